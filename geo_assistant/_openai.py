@@ -0,0 +1,135 @@
+import time
+import orjson
+import weakref
+import asyncio
+import threading
+import functools
+import httpx
+import openai
+
+from geo_assistant.config import Configuration
+
+
+class _PerLoop:
+    """
+    Holds a separate asyncio primitive for each running event loop. Primitives bind to the first
+        loop that waits on them, and the shared client outlives any one `asyncio.run`
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._by_loop = weakref.WeakKeyDictionary()
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        primitive = self._by_loop.get(loop)
+        if primitive is None:
+            primitive = self._by_loop[loop] = self._factory()
+        return primitive
+
+
+class _TokenBucket:
+    """
+    Refills continuously up to `per_minute`, callers wait until there is enough in the bucket
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+        # Only held to update the level, never while waiting for it to refill
+        self._lock = threading.Lock()
+
+    def _try_take(self, amount: float) -> float:
+        """
+        Takes `amount` from the bucket if there is enough, returning 0, otherwise returns how long
+            to wait until there will be
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.level >= amount:
+                self.level -= amount
+                return 0
+            return (amount - self.level) / self.rate
+
+    async def take(self, amount: float):
+        # A single request larger than the whole bucket still has to go through eventually
+        amount = min(amount, self.capacity)
+        while wait := self._try_take(amount):
+            await asyncio.sleep(wait)
+
+
+def _estimate_tokens(request: httpx.Request) -> int:
+    """
+    Estimates the tokens in a request (~4 characters per token) from the text in its JSON body,
+        so keys, quotes and escaping are not charged against the token budget
+    """
+    try:
+        body = orjson.loads(request.content)
+    except (httpx.RequestNotRead, orjson.JSONDecodeError):
+        return int(request.headers.get("content-length", 0)) // 4
+
+    chars = 0
+    stack = [body]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            chars += len(value)
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+    return chars // 4
+
+
+class _RateLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Transport that holds each request back until it fits within the configured request and token
+        rate limits, rather than sending it and reacting to a 429. Tokens are estimated from the
+        text in the request body
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        self._semaphores = _PerLoop(
+            functools.partial(asyncio.Semaphore, Configuration.openai_max_concurrent_requests)
+        )
+        self._requests = _TokenBucket(Configuration.openai_requests_per_minute)
+        self._tokens = _TokenBucket(Configuration.openai_tokens_per_minute)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await self._requests.take(1)
+        await self._tokens.take(_estimate_tokens(request))
+        async with self._semaphores.get():
+            return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+@functools.cache
+def get_async_client() -> openai.AsyncOpenAI:
+    """
+    Returns the process-wide AsyncOpenAI client. Agents and document stores share it, so they also
+        share a single connection pool and rate limit instead of each setting up their own.
+        Requests are made over HTTP/2, multiplexing concurrent calls over kept-alive connections
+
+    Returns:
+        openai.AsyncOpenAI: The shared client
+    """
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=Configuration.openai_max_connections,
+            max_keepalive_connections=Configuration.openai_max_connections,
+        ),
+    )
+    return openai.AsyncOpenAI(
+        api_key=Configuration.openai_key,
+        http_client=openai.DefaultAsyncHttpxClient(
+            transport=_RateLimitedTransport(transport),
+        ),
+    )
@@ -1,8 +1,9 @@
 import pathlib
-from typing import Any, Union, List, Dict, Optional
-from sqlalchemy.engine import Engine, Connection, Result
+from functools import lru_cache
+from typing import Any, Union, List, Dict, Optional, Iterator
+from sqlalchemy.engine import Engine, Connection, Result, RowMapping
 from sqlalchemy import text
-from jinja2 import Template
+from jinja2 import Environment, FileSystemLoader, Template
 
 from geo_assistant.logging import get_logger
 logger = get_logger(__name__)
@@ -10,42 +11,70 @@ logger = get_logger(__name__)
 # NOTE: The constant name preserves the original typo to avoid breaking references.
 TEMPATE_PATH = pathlib.Path(__file__).resolve().parent / "templates"
 
+# Templates are static for the life of the process, so never check the disk for changes
+_TEMPLATE_ENV = Environment(
+    loader=FileSystemLoader(TEMPATE_PATH),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    cache_size=-1,
+    auto_reload=False,
+)
+
+
+@lru_cache(maxsize=None)
+def _get_template(template_name: str) -> Template:
+    """
+    Loads and compiles a template from the `./templates` directory, once per name
+    """
+    return _TEMPLATE_ENV.get_template(template_name + ".sql")
+
+def _render_sql(template_name: str, *args: Any, **kwargs: Any) -> str:
+    """
+    Renders a template from the `./templates` directory into a SQL string
+    """
+    # Load template (compiled once, then served from cache)
+    template: Template = _get_template(template_name)
+    sql: str = template.render(*args, **kwargs).strip()
+    logger.debug("Executing SQL:\n%s", sql)
+    return sql
+
+
 def execute_template_sql(
     template_name: str,
     engine: Union[Engine, Connection],
     *args: Any,
+    as_dict: bool = False,
     **kwargs: Any
-) -> Optional[List[Dict[str, Any]]]:
+) -> Optional[List[RowMapping]]:
     """
     1. Load a Jinja2 template by name
     2. Render it with positional args + named kwargs
     3. Execute the SQL against the given SQLAlchemy engine/connection
-    4. If the statement returns rows, capture and return them as a list of dicts
+    4. If the statement returns rows, capture and return them as a list of row mappings
 
     Args:
         template_name (str): name of the template found in the `./templates` directory
         engine (Union[Engine, Connection]): SQLAlchemy Engine or Connection
+        as_dict (bool): If True, copy each row into a plain `dict`. Defaults to False, returning
+            the read-only, dict-like `RowMapping` objects without the extra copy
         *args, **kwargs: Any additional arguments to be injected into the template
 
     Returns:
-        Optional[List[Dict[str, Any]]]: Rows returned by the query as a list of dicts,
+        Optional[List[RowMapping]]: Rows returned by the query as a list of row mappings,
         or None if no rows were returned (e.g., DDL statements)
     """
-    # 1) Load template
-    template: Template = Template(
-        source=(TEMPATE_PATH / (template_name + ".sql")).read_text(), trim_blocks=True, lstrip_blocks=True
-    )
-    # 2) Render SQL
-    sql: str = template.render(*args, **kwargs).strip()
-    logger.debug("Executing SQL:\n%s", sql)
+    # 1 + 2) Load and render SQL
+    sql = _render_sql(template_name, *args, **kwargs)
 
-    def _process_result(result: Result) -> Optional[List[Dict[str, Any]]]:
+    def _process_result(result: Result) -> Optional[List[RowMapping]]:
         # Only return rows if the SQL returned any
         if not result.returns_rows:
             return None
         # Use mappings() to get rows as dict-like objects
         mappings = result.mappings().all()
-        return [dict(row) for row in mappings]
+        if as_dict:
+            return [dict(row) for row in mappings]
+        return mappings
 
     # 3) Execute and capture results
     if isinstance(engine, Engine):
@@ -56,3 +85,62 @@ def execute_template_sql(
         # It's already a Connection
         result = engine.execute(text(sql))  # noqa: DBAPI
         return _process_result(result)
+
+
+def iter_template_sql(
+    template_name: str,
+    engine: Union[Engine, Connection],
+    *args: Any,
+    yield_per: int = 1000,
+    **kwargs: Any
+) -> Iterator[RowMapping]:
+    """
+    Generator version of `execute_template_sql` for queries with large results. Rows are streamed
+        from a server-side cursor and fetched `yield_per` at a time, rather than loading the
+        entire result set into memory
+
+    Args:
+        template_name (str): name of the template found in the `./templates` directory
+        engine (Union[Engine, Connection]): SQLAlchemy Engine or Connection
+        yield_per (int): Number of rows to fetch from the cursor at a time. Defaults to 1000
+        *args, **kwargs: Any additional arguments to be injected into the template
+
+    Yields:
+        RowMapping: Each row returned by the query
+    """
+    sql = _render_sql(template_name, *args, **kwargs)
+    stmt = text(sql).execution_options(stream_results=True, yield_per=yield_per)
+
+    if isinstance(engine, Engine):
+        with engine.connect() as conn:
+            yield from conn.execute(stmt).mappings()
+    else:
+        yield from engine.execute(stmt).mappings()
+
+
+def execute_template_sql_batch(
+    templates: list[tuple[str, Dict[str, Any]]],
+    engine: Union[Engine, Connection],
+) -> None:
+    """
+    Renders several templates and executes them together as one multi-statement SQL string, in a
+        single transaction and a single round-trip to the database. Intended for DDL / statements
+        that do not return rows
+
+    Args:
+        templates (list[tuple[str, Dict[str, Any]]]): (template_name, kwargs) pairs, executed in
+            order
+        engine (Union[Engine, Connection]): SQLAlchemy Engine or Connection
+    """
+    statements = []
+    for template_name, kwargs in templates:
+        sql = _render_sql(template_name, **kwargs)
+        # Make sure one template's last statement is terminated before the next one starts
+        statements.append(sql if sql.endswith(";") else f"{sql};")
+    sql = "\n".join(statements)
+
+    if isinstance(engine, Engine):
+        with engine.begin() as conn:
+            conn.execute(text(sql))
+    else:
+        engine.execute(text(sql))  # noqa: DBAPI
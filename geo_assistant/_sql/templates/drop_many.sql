@@ -0,0 +1,36 @@
+{# templates/drop_many.sql #}
+
+{% for table in tables %}
+-- 1. drop the spatial index
+DROP INDEX IF EXISTS {{ table.name }}_geometry_idx;
+
+-- 2. unregister the geometry column
+-- (this removes the entry from geometry_columns)
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1
+    FROM information_schema.columns
+    WHERE table_schema = '{{ table.schema }}'
+      AND table_name   = '{{ table.name }}'
+      AND column_name  = 'geometry'
+  ) THEN
+    PERFORM DropGeometryColumn(
+      '{{ table.schema }}',
+      '{{ table.name }}',
+      'geometry'
+    );
+  END IF;
+END $$;
+
+-- 3. revoke read access from the tileserv role (the table may not exist, if it was never created)
+DO $$
+BEGIN
+  IF to_regclass('"{{ table.schema }}"."{{ table.name }}"') IS NOT NULL THEN
+    REVOKE SELECT ON "{{ table.schema }}"."{{ table.name }}" FROM PUBLIC;
+  END IF;
+END $$;
+{% endfor %}
+
+-- 4. drop every table and all dependents in one statement
+DROP TABLE IF EXISTS {% for table in tables %}"{{ table.schema }}"."{{ table.name }}"{{ ", " if not loop.last }}{% endfor %} CASCADE;
@@ -0,0 +1,37 @@
+{# templates/geometry_typmod.sql #}
+
+-- Concrete geometry types recorded in the catalog, tables with one of these are never scanned
+WITH catalog AS (
+  SELECT f_table_schema, f_table_name, upper(type) AS geom_type
+  FROM geometry_columns
+  WHERE f_geometry_column = '{{ geometry_column }}'
+    AND (f_table_schema, f_table_name) IN (
+{% for table in tables %}
+      ('{{ table.source_schema }}', '{{ table.source_table }}'){{ "," if not loop.last }}
+{% endfor %}
+    )
+    AND upper(type) <> 'GEOMETRY'
+),
+
+-- Types of every source table, from the catalog when typed, otherwise from its rows
+types AS (
+  SELECT geom_type FROM catalog
+{% for table in tables %}
+  UNION
+  SELECT DISTINCT GeometryType("{{ geometry_column }}")
+  FROM "{{ table.source_schema }}"."{{ table.source_table }}"
+  WHERE NOT EXISTS (
+    SELECT 1 FROM catalog
+    WHERE f_table_schema = '{{ table.source_schema }}' AND f_table_name = '{{ table.source_table }}'
+  )
+{% endfor %}
+)
+
+-- Pick the Multi* typmod every type fits into, or fall back to a collection
+SELECT CASE
+  WHEN coalesce(bool_and(geom_type IN ('POLYGON', 'MULTIPOLYGON')), true) THEN 'MultiPolygon'
+  WHEN bool_and(geom_type IN ('LINESTRING', 'MULTILINESTRING')) THEN 'MultiLineString'
+  WHEN bool_and(geom_type IN ('POINT', 'MULTIPOINT')) THEN 'MultiPoint'
+  ELSE 'GeometryCollection'
+END AS typmod
+FROM types;
@@ -1,12 +1,14 @@
-import json
+import orjson
+import hashlib
+import asyncio
 import pathlib
 from typing import Callable, Literal
 from sqlalchemy import Engine
 from openai.types.responses import ParsedResponse
-from jinja2 import Template
+from jinja2 import Environment, FileSystemLoader
 
 # Import for declaring agent
-from geo_assistant.agent._base import BaseAgent, tool, tool_type, system_message, postchat
+from geo_assistant.agent._base import BaseAgent, tool, tool_type, system_message, postchat, versioned_enum
 from geo_assistant.agent.updates import EmitUpdate, Status
 
 # Import geo assisant stuff
@@ -23,6 +25,13 @@ from geo_assistant.agent.analysis.report import TableCreated, PlotlyMapLayerArgu
 
 logger = get_logger(__name__)
 
+# The analysis system message template is loaded and compiled once, then rendered per analysis
+_TEMPLATE_ENV = Environment(
+    loader=FileSystemLoader(pathlib.Path(__file__).resolve().parent),
+    auto_reload=False,
+)
+ANALYSIS_SYSTEM_MESSAGE = _TEMPLATE_ENV.get_template("system_message.j2")
+
 GEO_AGENT_SYSTEM_MESSAGE = """
 You are a geo-assistant who is an expert at making maps in GIS software. You will be given access
 to a large dataset of GeoJSON data, and you are tasked to keep the map in a state that best reflects
@@ -84,6 +93,17 @@ class GeoAgent(BaseAgent):
         self.map_handler: PlotlyMapHandler = map_handler
         self.data_handler: PostGISHandler = data_handler
         self.registry: TableRegistry = TableRegistry.load_from_tileserv(self.engine)
+        # Filter type schemas, keyed by the (name, table, format) of the fields they were built from
+        self._filter_type_cache: dict[tuple, dict[str, dict]] = {}
+        # Last rendered system message, along with the map version, context and tables it was
+        #   rendered from
+        self._system_message_key: tuple = None
+        self._system_message_cache: str = None
+        # Handlers for each type of item in an analysis report, ran once the analysis finishes.
+        #   Created tables are handled as their steps finish instead, see `run_analysis`
+        self._report_item_handlers: dict[type, Callable] = {
+            PlotlyMapLayerArguements: self._handle_map_layer,
+        }
 
         # Set the field store depending if given or not
         if field_store is None:
@@ -100,21 +120,50 @@ class GeoAgent(BaseAgent):
     @system_message
     async def _system_message(self, user_message: str):
         # load context and inject as system prompt
-        tables = self.registry[('schema', 'base')]
+        tables = self.registry.base_tables
         context = await self.info_store.query(user_message, k=3)
         context = "\n\n".join(r['markdown'] for r in context)
-        return GEO_AGENT_SYSTEM_MESSAGE.format(
-            map_status=self.map_handler.status,
-            context=context,
-            tables=[table.name for table in tables]
+        table_names = [table.name for table in tables]
+        # Only re-render when the map, context, or tables have changed since the last turn
+        key = (self.map_handler._version, context, tuple(table_names))
+        if key != self._system_message_key:
+            self._system_message_cache = GEO_AGENT_SYSTEM_MESSAGE.format(
+                # Compact JSON, whitespace costs prompt tokens without helping the model
+                map_status=orjson.dumps(self.map_handler.status).decode(),
+                context=context,
+                tables=table_names
+            )
+            self._system_message_key = key
+        return self._system_message_cache
+
+    async def _handle_table_created(self, analysis: _GISAnalysis, item: TableCreated):
+        # Registering hits tileserv and the database, keep it off the event loop
+        table = await asyncio.to_thread(
+            self.registry.register,
+            id_=f"{analysis.name}.{item.table_created}",
+            engine=self.engine
+        )
+        await asyncio.to_thread(table._postprocess, self.engine)
+
+    async def _handle_map_layer(self, analysis: _GISAnalysis, item: PlotlyMapLayerArguements):
+        schema, table = item.source_table.split('.')
+        table = self.registry[
+            ('schema', schema),
+            ('table', table)
+        ][0]
+        self.map_handler._add_map_layer(
+            table=table, 
+            color=item.color, 
+            layer_id=item.layer_id
         )
 
     async def _emit_figure(self, fig: str):
         if self.emitter:
+            # Both values are built right here with the right types, skip validating them
             await self.emitter(
-                FigureUpdate(
+                FigureUpdate.model_construct(
                     status=Status.SUCCEDED,
-                    figure=json.dumps(fig)
+                    figure=orjson.dumps(fig, option=orjson.OPT_SERIALIZE_NUMPY).decode()
                 )
             )
 
@@ -127,11 +176,26 @@ class GeoAgent(BaseAgent):
         Returns a map of JSON-Schema properties for a single filter clause.
         """
         fields = await self.field_store.query(user_message)
+        # The same set of fields yields the same schema, return the cached object so the
+        #   assembled tool schemas can be reused too
+        key = tuple((f["name"], f.get("table"), f.get("format")) for f in fields)
+        if key not in self._filter_type_cache:
+            if len(self._filter_type_cache) >= 128:
+                self._filter_type_cache.clear()
+            self._filter_type_cache[key] = self._build_filter_props(fields)
+        return self._filter_type_cache[key]
+
+    @staticmethod
+    def _build_filter_props(fields: list[dict]) -> dict[str, dict]:
         return {
             "field": {
                 "type": "string",
                 "enum": [f["name"] for f in fields],
-                "description": json.dumps(fields),
+                # Distances are query specific and don't help the model pick a field
+                "description": orjson.dumps([
+                    {k: v for k, v in f.items() if k != "distance"}
+                    for f in fields
+                ]).decode(),
             },
             "op": {
                 "type": "string",
@@ -152,20 +216,22 @@ class GeoAgent(BaseAgent):
         name="add_map_layer",
         description="Add a layer to the map with optional CQL filters",
         params={
-            "table":    {"type":"string", "enum": lambda self: [t.name for t in self.registry[('schema', 'base')]]},
+            "table":    {"type":"string", "enum": versioned_enum(
+                lambda self: self.registry._version,
+                lambda self: [t.name for t in self.registry.base_tables],
+            )},
             "layer_id": {"type":"string"},
             "style":    {"type":"string"},
             "color":    {"type":"string", "description": "A hex value for the color of the layer"},
             "filters":  {"type": "array", "items": {"type": "#filter"}},
         },
         required=["table","layer_id", "color"],
+        narrate=False,
+        concurrent=True,
     )
     async def add_map_layer(self, table: str, color: str, layer_id: str, style: str = 'line', filters: list[dict]=None) -> str:
         if filters:
-            filters = [
-                HandlerFilter(**filter_)
-                for filter_ in filters
-            ]
+            filters = [HandlerFilter.model_validate(filter_) for filter_ in filters]
         table = self.registry[('table', table)][0]
         self.map_handler._add_map_layer(
             table=table, 
@@ -174,19 +240,29 @@ class GeoAgent(BaseAgent):
             color=color, 
             layer_id=layer_id
         )
-        # Emit the udpated figure
-        await self._emit_figure(self.map_handler.update_figure().to_plotly_json())
-        count = self.data_handler.filter_count(self.engine, table, filters)
-        return f"Layer {layer_id} add with {count} rows"
+        # Emit the udpated figure while the row count runs in the database
+        _, count = await asyncio.gather(
+            self._emit_figure(self.map_handler.update_figure().to_plotly_json()),
+            asyncio.to_thread(self.data_handler.filter_count, self.engine, table, filters),
+        )
+        return f"Layer {layer_id} added with {count} rows"
 
     @tool(
         name="remove_map_layer",
         description="Remove a layer by its ID",
-        params={"layer_id":{"type":"string", "enum": lambda self: list(self.map_handler.map_layers.keys())}},
+        params={"layer_id":{"type":"string", "enum": versioned_enum(
+            lambda self: self.map_handler._version,
+            lambda self: list(self.map_handler.map_layers.keys()),
+        )}},
         required=["layer_id"],
+        narrate=False,
     )
     async def remove_map_layer(self, layer_id: str) -> bool:
+        version = self.map_handler._version
         self.map_handler._remove_map_layer(layer_id)
+        # The result goes straight to the user, so say so when there was no such layer
+        if self.map_handler._version == version:
+            return f"There is no layer {layer_id} on the map"
         # Emit the udpated figure
         await self._emit_figure(self.map_handler.update_figure().to_plotly_json())
         return f"Layer {layer_id} removed from map"
@@ -194,12 +270,13 @@ class GeoAgent(BaseAgent):
     @tool(
         name="reset_map",
         description="Resets the map, removing all layers",
+        narrate=False,
     )
     async def reset_map(self):
         self.map_handler._reset_map()
         # Emit the udpated figure
         await self._emit_figure(self.map_handler.update_figure().to_plotly_json())
-        return "Map reseted"
+        return "Map reset"
 
     @tool(
         name="run_analysis",
@@ -220,7 +297,8 @@ class GeoAgent(BaseAgent):
             Args:
                 - query(str): Text descibing what the analysis should accomplish
             """
-            analysis_id = str(abs(hash(goal)))
+            # Stable across restarts, unlike the per-process randomized `hash`
+            analysis_id = hashlib.blake2b(goal.encode("utf-8"), digest_size=8).hexdigest()
             if self.emitter:
                 await self.emitter(
                     AnalysisUpdate(
@@ -234,11 +312,23 @@ class GeoAgent(BaseAgent):
 
                 
             logger.info(f"Running analysis for query: {goal}")
-            # Setup the system message template
-            system_message_template = Template(source=pathlib.Path("./geo_assistant/agent/system_message.j2").read_text())
-            # Query for relevant fields
-            field_defs = await self.field_store.query(goal, k=15)
-            field_defs = self.registry.verify_fields(field_defs)
+            # Query for relevant fields and info at the same time, the lookups are independent.
+            #   Fields are only searched among those that exist in a registered table, so results
+            #   are not wasted on fields verification would drop. A filtered graph search can
+            #   still return fewer than k
+            field_defs, context = await asyncio.gather(
+                self.field_store.query(
+                    goal,
+                    k=15,
+                    subset=self.field_store.positions_for_names(self.registry.column_names)
+                ),
+                self.info_store.query(goal, k=10),
+            )
+            # A column shared by several tables is verified once per table, keep only the first
+            unique_defs: dict[str, dict] = {}
+            for field in self.registry.verify_fields(field_defs):
+                unique_defs.setdefault(field['name'], field)
+            field_defs = list(unique_defs.values())
             field_names = [field['name'] for field in field_defs]
             # Query registry for all tables that make up the set of fields
             tables = self.registry[('schema', Configuration.db_base_schema), ('fields', field_names)]
@@ -249,10 +339,8 @@ class GeoAgent(BaseAgent):
                 fields=field_names,
                 tables=[table.name for table in tables]
             )
-            # Query for relative info
-            context = await self.info_store.query(goal, k=10)
             # Generate the system message
-            system_message = system_message_template.render(
+            system_message = ANALYSIS_SYSTEM_MESSAGE.render(
                 field_definitions=field_defs,
                 context_info=context,
                 tables=tables
@@ -291,44 +379,48 @@ class GeoAgent(BaseAgent):
             # Run through the steps, executing each query
             logger.debug(f"Steps: {[step.name for step in analysis.steps]}")
 
+            # Registrations of the tables created so far, running alongside the later steps
+            registrations: list[asyncio.Task] = []
             try:
                 async def _step_emitter(update_dict: dict):
                     await self.emitter(
                         AnalysisUpdate.model_validate(update_dict)
                     )
 
+                async def _on_item(item):
+                    # Created tables are independent of each other, so each is registered and
+                    #   postprocessed as soon as its step finishes, on its own pooled connection
+                    if type(item) is TableCreated:
+                        registrations.append(
+                            asyncio.create_task(self._handle_table_created(analysis, item))
+                        )
+
                 # Execute and gather the report
                 report = await analysis.execute(
                     id_=analysis_id, 
                     engine=self.engine, 
                     emitter=_step_emitter,
-                    query=goal
+                    query=goal,
+                    on_item=_on_item,
                 )
-                # Perform any actions required based on the report
+                # Perform any actions required based on the report. Map layers may reference the
+                #   created tables, so wait on those first
+                await asyncio.gather(*registrations)
+                map_version = self.map_handler._version
                 for item in report.items:
-                    if isinstance(item, TableCreated):
-                        table = self.registry.register(
-                            id_=f"{analysis.name}.{item.table_created}",
-                            engine=self.engine
-                        )
-                        table._postprocess(self.engine)
-                    elif isinstance(item, PlotlyMapLayerArguements):
-                        schema, table = item.source_table.split('.')
-                        table = self.registry[
-                            ('schema', schema),
-                            ('table', table)
-                        ][0]
-                        self.map_handler._add_map_layer(
-                            table=table, 
-                            color=item.color, 
-                            layer_id=item.layer_id
-                        )
-                        # Emit the udpated figure
-                        await self._emit_figure(self.map_handler.update_figure().to_plotly_json())
-                    else:
+                    # Already registered by `_on_item`
+                    if type(item) is TableCreated:
+                        continue
+                    handler = self._report_item_handlers.get(type(item))
+                    if handler is None:
                         logger.warning(
                             f"Report item type {type(item)} handler not implemented"
                         )
+                        continue
+                    await handler(analysis, item)
+                # Emit the updated figure once, with every new layer, rather than once per layer
+                if self.map_handler._version != map_version:
+                    await self._emit_figure(self.map_handler.update_figure().to_plotly_json())
                 report_succeded = True
             except Exception as e:
                 if self.emitter:
@@ -343,15 +435,19 @@ class GeoAgent(BaseAgent):
                     )
                 raise e
             finally:
+                # Let any registration still running settle before syncing and dropping
+                await asyncio.gather(*registrations, return_exceptions=True)
                 # No matter what, drop all the tables but the last possible
                 logger.debug(analysis.tables_created)
                 logger.debug(analysis.final_tables)
-                self.registry.sync_tileserv(self.engine)
-                for table_name in analysis.tables_created:
-                    if table_name not in analysis.final_tables:
-                        logger.info(f"Dropping {table_name}...")
-                        schema, table = table_name.split('.')
-                        self.registry[('schema', schema), ('table', table)][0]._drop(self.engine)
+                await asyncio.to_thread(self.registry.sync_tileserv, self.engine)
+                intermediate_names = set(analysis.tables_created) - set(analysis.final_tables)
+                logger.info(f"Dropping {sorted(intermediate_names)}...")
+                # Drop them all by name in a single round-trip, including any that failed to
+                #   register, so nothing is left behind
+                await asyncio.to_thread(
+                    self.registry.drop_many, self.engine, sorted(intermediate_names)
+                )
             if self.emitter:
                 await self.emitter(
                     AnalysisUpdate(
@@ -366,5 +462,5 @@ class GeoAgent(BaseAgent):
             return (
                 f"GIS Analysis ran succussfully."
                 f"Report description:"
-                f"{report.model_dump_json(indent=2)}"
+                f"{orjson.dumps(report.model_dump(mode='json')).decode()}"
             )
\ No newline at end of file
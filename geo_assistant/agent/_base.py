@@ -1,12 +1,16 @@
+import uuid
+import asyncio
+import functools
 import inspect
-import json
+import orjson
 import openai
-from typing import Callable, Any
+from typing import Callable, Any, Hashable
 
 from geo_assistant.config import Configuration
 from geo_assistant.logging import get_logger
+from geo_assistant._openai import get_async_client
 
-from geo_assistant.agent.updates import AiUpdate, Status, EmitUpdate, ToolUpdate
+from geo_assistant.agent.updates import AiUpdate, AiDeltaUpdate, Status, EmitUpdate, ToolUpdate
 
 logger = get_logger(__name__)
 
@@ -16,6 +20,49 @@ class SystemMessageNotDeclared(Exception):
         super().__init__("System message not declared on agent. One function must use `@system_message`")
 
 
+_TOOL_DEF_CACHE_SIZE = 128
+
+
+def _referenced_types(params: dict[str, dict]) -> set[str]:
+    """
+    Helper function to find the names of all `@tool_type` definitions a tool's params reference,
+        either directly ("type": "#name") or as array items
+    """
+    refs = set()
+    for spec in params.values():
+        for s in (spec, spec.get("items")):
+            if isinstance(s, dict) and isinstance(s.get("type"), str) and s["type"].startswith("#"):
+                refs.add(s["type"][1:])
+    return refs
+
+
+def _estimate_tokens(message: Any) -> int:
+    """
+    Helper function to cheaply estimate the number of tokens in a message (~4 chars per token)
+    """
+    if isinstance(message, dict):
+        text = message.get("content") or message.get("output") or message.get("arguments") or ""
+    else:
+        # Tool call items from the responses api
+        text = getattr(message, "arguments", "") or ""
+    return len(str(text)) // 4 + 1
+
+
+def _encode_tool_output(result: Any) -> str:
+    """
+    Helper function to turn a tool's result into the string the responses api expects. Structured
+        results are encoded once with orjson, rather than left for the client to re-serialize
+    """
+    if isinstance(result, str):
+        return result
+    if isinstance(result, bytes):
+        return result.decode()
+    try:
+        return orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    except TypeError:
+        return str(result)
+
+
 async def _safe_run(fn, *args, **kwargs):
     """
     Helper function to always run a function, async or not
@@ -45,6 +92,20 @@ def postchat(fn):
     return fn
 
 
+def versioned_enum(version: Callable[[Any], Hashable], values: Callable[[Any], list]) -> Callable:
+    """
+    Marks a tool param's dynamic `enum` builder as only depending on `version(agent)`. The values
+        are then only rebuilt when the version changes, rather than every time the tool schemas
+        are built
+
+    Args:
+        version (Callable): Returns a hashable version of whatever the values are built from
+        values (Callable): The enum builder, called with the agent
+    """
+    values._enum_version = version
+    return values
+
+
 def tool(
     *,
     name: str = None,
@@ -53,9 +114,18 @@ def tool(
     required: list[str] = None,
     preprocess: Callable[[dict], dict] = None,
     postprocess: Callable[[Any], Any] = None,
+    narrate: bool = True,
+    concurrent: bool = False,
 ):
     """
     Decorator to mark a method as a callable tool.
+
+    Tools declared with `narrate=False` return a result that can be shown to the user as is. If
+        every tool called in a turn is one of these (and none failed), the agent skips the second
+        LLM call that would otherwise be made to describe the results.
+
+    Tools declared with `concurrent=True` are safe to run alongside other calls of concurrent
+        tools. When the model makes several of these calls in a row, they are run together.
     """
     def decorator(fn: Callable):
         fn._tool_meta = {
@@ -66,6 +136,8 @@ def tool(
             "pre":         preprocess,
             "post":        postprocess,
             "method":      fn.__name__,
+            "narrate":     narrate,
+            "concurrent":  concurrent,
         }
         return fn
     return decorator
@@ -123,16 +195,29 @@ class BaseAgent:
         model: str = Configuration.inference_model,
         emitter: Callable[[AiUpdate], None] = None
     ):
-        self.client: openai.AsyncOpenAI = openai.AsyncOpenAI(api_key=Configuration.openai_key)
+        self.client: openai.AsyncOpenAI = get_async_client()
         self.model: str = model
         self.emitter = emitter
         self.messages: list[dict] = []
+        # Estimated token count of each message, and the running total of the history after the
+        #   system message. Kept up to date by `_append_message`
+        self._message_tokens: list[int] = []
+        self._history_tokens: int = 0
+        # Assembled tool schemas, keyed by everything the schema depends on
+        self._tool_def_cache: dict[tuple, dict] = {}
+        # Values of versioned enums, keyed by (tool, param), along with the version they were
+        #   built for
+        self._enum_cache: dict[tuple[str, str], tuple[Hashable, list, tuple]] = {}
 
     async def _build_tool_defs(self, user_message: str) -> list[dict]:
         # 1) Build dynamic types from @tool_type
         definitions: dict[str, dict] = {}
-        for type_name, builder in self._tool_type_registry.items():
-            props = await _safe_run(builder, self, user_message)
+        # Builders commonly run their own lookups, so they are run concurrently
+        builders = list(self._tool_type_registry.items())
+        all_props = await asyncio.gather(*[
+            _safe_run(builder, self, user_message) for _, builder in builders
+        ])
+        for (type_name, builder), props in zip(builders, all_props):
             definitions[type_name] = {
                 "type":        "object",
                 "description": builder._tool_type_meta["description"],
@@ -142,19 +227,39 @@ class BaseAgent:
 
         # 2) Build each @tool function schema
         tool_defs: list[dict] = []
-        for attr in dir(self.__class__):
-            fn = getattr(self.__class__, attr)
-            if not hasattr(fn, "_tool_meta"):
-                continue
+        for fn in self._decorated("_tool_meta"):
             meta = fn._tool_meta
 
+            # Resolve the dynamic parts of the schema first, if none of them changed since the
+            #   last build then the cached schema can be reused as is
+            enums = {
+                pname: self._resolve_enum(meta["name"], pname, spec["enum"])
+                for pname, spec in meta["params"].items()
+                if callable(spec.get("enum"))
+            }
+            # Definitions are keyed by identity, builders that return the same properties object
+            #   for the same inputs get cache hits. The cached schema holds a reference to each
+            #   definition, so the ids can not be recycled while the entry exists
+            cache_key = (
+                meta["name"],
+                tuple((pname, values) for pname, (_, values) in enums.items()),
+                tuple(
+                    (name, id(definitions[name]["properties"]))
+                    for name in sorted(_referenced_types(meta["params"]))
+                    if name in definitions
+                ),
+            )
+            if cache_key in self._tool_def_cache:
+                tool_defs.append(self._tool_def_cache[cache_key])
+                continue
+
             # track which definitions this tool actually uses
             used_defs: set[str] = set()
             props: dict[str, dict] = {}
             for pname, spec in meta["params"].items():
                 s = spec.copy()
-                if callable(s.get("enum")):
-                    s["enum"] = s["enum"](self)
+                if pname in enums:
+                    s["enum"] = enums[pname][0]
                 # shorthand: "type":"#foo"
                 if isinstance(s.get("type"), str) and s["type"].startswith("#"):
                     ref_name = s["type"][1:]
@@ -182,56 +287,225 @@ class BaseAgent:
                     if name in definitions
                 }
 
-            tool_defs.append({
+            tool_def = {
                 "type":        "function",
                 "name":        meta["name"],
                 "description": meta["description"],
                 "parameters":  parameters,
-            })
+            }
+            # Keep the cache bounded, schemas are cheap to rebuild
+            if len(self._tool_def_cache) >= _TOOL_DEF_CACHE_SIZE:
+                self._tool_def_cache.clear()
+            self._tool_def_cache[cache_key] = tool_def
+            tool_defs.append(tool_def)
 
         return tool_defs
 
+    def _resolve_enum(self, tool_name: str, pname: str, builder: Callable) -> tuple[list, tuple]:
+        """
+        Builds the values of a dynamic enum, reusing the last values of a versioned enum while its
+            version is unchanged
+
+        Returns:
+            tuple[list, tuple]: The values, and the same values as a hashable tuple
+        """
+        version_fn = getattr(builder, "_enum_version", None)
+        if version_fn is None:
+            values = builder(self)
+            return values, tuple(values)
+        version = version_fn(self)
+        cached = self._enum_cache.get((tool_name, pname))
+        if cached is None or cached[0] != version:
+            values = builder(self)
+            cached = (version, values, tuple(values))
+            self._enum_cache[(tool_name, pname)] = cached
+        return cached[1], cached[2]
+
+    @classmethod
+    @functools.cache
+    def _decorated(cls, marker: str) -> tuple[Callable, ...]:
+        """
+        Finds the methods of the agent class carrying a decorator's marker attribute. Cached per
+            class, as the decorated methods are fixed once the class is defined
+        """
+        return tuple(
+            fn
+            for attr in dir(cls)
+            if hasattr(fn := getattr(cls, attr), marker)
+        )
+
     @property
     def _prechat_func(self) -> Callable | None:
-        for attr in dir(self.__class__):
-            fn = getattr(self.__class__, attr)
-            if hasattr(fn, "_is_prechat"):
-                return fn
-        return None
+        return next(iter(self._decorated("_is_prechat")), None)
 
     @property
     def _postchat_func(self) -> Callable | None:
-        for attr in dir(self.__class__):
-            fn = getattr(self.__class__, attr)
-            if hasattr(fn, "_is_postchat"):
-                return fn
-        return None
+        return next(iter(self._decorated("_is_postchat")), None)
+
+    def _append_message(self, message: Any) -> None:
+        """
+        Appends a message to the conversation, keeping the token accounting up to date
+        """
+        tokens = _estimate_tokens(message)
+        self.messages.append(message)
+        self._message_tokens.append(tokens)
+        if len(self.messages) > 1:
+            self._history_tokens += tokens
+
+    def _trim_messages(self, max_tokens: int = Configuration.max_history_tokens) -> None:
+        """
+        Drops the oldest turns of the conversation once the history goes over `max_tokens`, so
+            the prompt sent on each turn stays bounded. The system message is always kept, and
+            the history is only ever cut at a user message, so tool calls are never separated
+            from their outputs. The latest user turn is always kept, even if it is over budget.
+        """
+        # Most turns are under budget, which the running total answers without a scan
+        if self._history_tokens <= max_tokens:
+            return
+        total = 0
+        cut = None
+        for i in range(len(self.messages) - 1, 0, -1):
+            message = self.messages[i]
+            total += self._message_tokens[i]
+            is_user = isinstance(message, dict) and message.get("role") == "user"
+            if is_user and (total <= max_tokens or cut is None):
+                cut = i
+            if total > max_tokens and cut is not None:
+                break
+        if cut and cut > 1:
+            logger.debug(f"Trimming {cut - 1} messages from the conversation history")
+            del self.messages[1:cut]
+            self._history_tokens -= sum(self._message_tokens[1:cut])
+            del self._message_tokens[1:cut]
 
     async def _build_system_message(self, user_message: str) -> str:
-        for attr in dir(self.__class__):
-            fn = getattr(self.__class__, attr)
-            if hasattr(fn, "_is_system_message"):
-                return await _safe_run(fn, self, user_message)
+        for fn in self._decorated("_is_system_message"):
+            return await _safe_run(fn, self, user_message)
         raise SystemMessageNotDeclared()
 
 
-    async def chat(self, user_message: str) -> str:
+    async def _call_tool(self, tool_call) -> tuple[Any, bool]:
+        """
+        Runs a single tool call from the model, emitting updates
+
+        Args:
+            tool_call: A function call output item from the responses api
+        Returns:
+            tuple[Any, bool]: The result to send back to the model, and if it needs narrating
+        """
+        # Log the raw arguments lazily, rather than formatting the parsed dict back into a string
+        logger.info("Calling %s with kwargs: %s", tool_call.name, tool_call.arguments)
+
+        # Run the tool, emitting updates. Malformed arguments from the model are a tool failure
+        #   like any other
+        kwargs = None
+        try:
+            # Lookup the bound method, only ever calling methods declared as tools
+            handler = getattr(self, tool_call.name, None)
+            if getattr(handler, "_tool_meta", None) is None:
+                raise AttributeError(f"`{tool_call.name}` is not a tool")
+            kwargs  = orjson.loads(tool_call.arguments)
+            if self.emitter:
+                # The arguments were just parsed from json, skip validating them a second time
+                await _safe_run(
+                    self.emitter,
+                    ToolUpdate.model_construct(
+                        status=Status.PROCESSING,
+                        tool_call=tool_call.name,
+                        tool_args=kwargs
+                    )
+                )
+            result = await _safe_run(handler, **kwargs)
+            return result, handler._tool_meta["narrate"]
+        except Exception as e:
+            logger.exception(e)
+            if self.emitter:
+                await _safe_run(
+                    self.emitter,
+                    ToolUpdate.model_construct(
+                        status=Status.ERROR,
+                        tool_call=tool_call.name,
+                        tool_args=kwargs
+                    )
+                )
+            # Failures always go back through the LLM to be explained to the user
+            result = f"Tool `{tool_call.name}` failed: {e}. Please kindly state to the user that is failed, provide context, and ask if they want to try again."
+            return result, True
+
+    async def _stream_response(
+        self,
+        response_id: str,
+        on_token: Callable[[str], Any] = None,
+        on_tool_call: Callable[[Any], Any] = None,
+        **kwargs
+    ):
+        """
+        Generates a response with the streaming api, emitting text to the emitter as it arrives
+            rather than after the whole response is complete
+
+        Args:
+            response_id (str): ID shared by all updates for this ai response
+            on_token (Callable[[str], Any]): Optional callback, called with each piece of text
+            on_tool_call (Callable[[Any], Any]): Optional callback, called with each function call
+                as soon as its arguments are complete, while the rest of the response generates
+            **kwargs: Arguments for `responses.stream`
+        Returns:
+            Response: The final, complete response
+        """
+        async with self.client.responses.stream(**kwargs) as stream:
+            async for event in stream:
+                if event.type == "response.output_item.done":
+                    if on_tool_call and event.item.type == "function_call":
+                        await _safe_run(on_tool_call, event.item)
+                    continue
+                if event.type != "response.output_text.delta":
+                    continue
+                if on_token:
+                    await _safe_run(on_token, event.delta)
+                if self.emitter:
+                    await _safe_run(
+                        self.emitter,
+                        AiDeltaUpdate(
+                            status=Status.GENERATING,
+                            id=response_id,
+                            delta=event.delta
+                        )
+                    )
+            return await stream.get_final_response()
+
+    async def chat(self, user_message: str, on_token: Callable[[str], Any] = None) -> str:
+        """
+        Generates a response to the user message, calling any tools the model requests
+
+        Args:
+            user_message (str): The user's message
+            on_token (Callable[[str], Any]): Optional callback, called with each piece of the
+                response text as it is generated. Updates are also sent through the emitter
+        Returns:
+            str: The complete response
+        """
         # First, run a prechat processing function if one was given
         if self._prechat_func:
             user_message = await _safe_run(self._prechat_func, self, user_message)
 
-        # Generate and insert the new system message
-        system_message = {"role": "developer", "content": await self._build_system_message(user_message)}
+        # Generate the new system message and the tool list. Both only depend on the user message,
+        #   so their lookups are run concurrently
+        system_content, tool_defs = await asyncio.gather(
+            self._build_system_message(user_message),
+            self._build_tool_defs(user_message),
+        )
+
+        # Insert the new system message
+        system_message = {"role": "developer", "content": system_content}
         if self.messages:
             self.messages[0] = system_message
         else:
-            self.messages.append(system_message)
-        self.messages.append({"role":"user","content":user_message})
-
-        # Create the tool list
-        tool_defs = await self._build_tool_defs(user_message)
+            self._append_message(system_message)
+        self._append_message({"role":"user","content":user_message})
+        self._trim_messages()
 
         # Begin the first pass on generating a response from openai
+        response_id = str(uuid.uuid4())
         if self.emitter:
             await _safe_run(
                 self.emitter,
@@ -239,14 +513,76 @@ class BaseAgent:
                     status=Status.GENERATING,
                 )
             )
+        # Tool calls are started as soon as each one has streamed in, rather than after the whole
+        #   response. Consecutive calls to concurrent tools run together, any other tool runs on
+        #   its own, after every call before it has finished
+        tool_tasks: list[tuple[Any, asyncio.Task]] = []
+        # Calls the current group has to wait for, and if the current group is concurrent
+        after: list[asyncio.Task] = []
+        group_concurrent = False
+
+        def _record(tool_call, outcome) -> tuple[str, bool]:
+            # Record a call and its output for the LLM, so every call made has an output
+            if isinstance(outcome, BaseException):
+                # `_call_tool` handles tool errors itself, this only catches anything that escapes
+                #   it
+                logger.error("Tool `%s` did not complete: %r", tool_call.name, outcome)
+                outcome = (f"Tool `{tool_call.name}` failed: {outcome!r}", True)
+            result, narrate = outcome
+            output = _encode_tool_output(result)
+            # Only keep what the model needs to tie the output back to the call
+            self._append_message({
+                "type": "function_call",
+                "call_id": tool_call.call_id,
+                "name": tool_call.name,
+                "arguments": tool_call.arguments,
+            })
+            self._append_message({
+                "type": "function_call_output",
+                "call_id": tool_call.call_id,
+                "output": output
+            })
+            return output, narrate
+
+        async def _call_tool_after(waits: list[asyncio.Task], tool_call):
+            if waits:
+                await asyncio.wait(waits)
+            return await self._call_tool(tool_call)
+
+        def _dispatch(tool_call):
+            nonlocal after, group_concurrent
+            # Unknown tools still get a task, `_call_tool` turns them into a tool failure
+            meta = getattr(getattr(self, tool_call.name, None), "_tool_meta", None)
+            concurrent = bool(meta and meta["concurrent"])
+            if not (concurrent and group_concurrent):
+                after = [task for _, task in tool_tasks]
+                group_concurrent = concurrent
+            tool_tasks.append(
+                (tool_call, asyncio.create_task(_call_tool_after(after, tool_call)))
+            )
+
         try:
-            response = await self.client.responses.create(
+            response = await self._stream_response(
+                response_id,
+                on_token,
+                _dispatch,
                 model=self.model,
                 input=self.messages,
                 tools=tool_defs,
             )
         except Exception as e:
             logger.exception(e)
+            # Do not leave tools from a failed response running. Wait for them to stop, as tools
+            #   clean up after themselves when cancelled, and keep the calls that had already
+            #   finished, since they may have changed the map or database
+            for _, task in tool_tasks:
+                task.cancel()
+            outcomes = await asyncio.gather(
+                *[task for _, task in tool_tasks], return_exceptions=True
+            )
+            for (tool_call, _), outcome in zip(tool_tasks, outcomes):
+                if not isinstance(outcome, asyncio.CancelledError):
+                    _record(tool_call, outcome)
             # On failure, emit an udpate, update the messages, and return a standard message
             if self.emitter:
                 await _safe_run(
@@ -255,60 +591,42 @@ class BaseAgent:
                         status=Status.ERROR,
                     )
                 )
-            self.messages.append(
+            self._append_message(
                 {'role': 'assistant', 'content': 'Failed to generate a response'}
             )
             return f"OpenAI failed to generate a response: {e}"
 
-        # Dispatch any tool calls
-        made_calls = False
-        for tool_call in response.output:
-            if tool_call.type != "function_call":
-                continue
-            self.messages.append(tool_call)
-            made_calls = True
-            # Lookup the bound method
-            handler = getattr(self, tool_call.name)
-            kwargs  = json.loads(tool_call.arguments)
-
-            logger.info(f"Calling {tool_call.name} with kwargs: {kwargs}")
-
-            # Run the tool, emitting updates
-            try:
-                if self.emitter:
-                    await _safe_run(
-                    self.emitter,
-                        ToolUpdate(
-                                status=Status.PROCESSING,
-                                tool_call=tool_call.name,
-                                tool_args=kwargs
-                            )
-                    )
-                result = await _safe_run(handler, **kwargs)
-            except Exception as e:
-                logger.exception(e)
-                result = f"Tool `{tool_call.name}` failed: {e}. Please kindly state to the user that is failed, provide context, and ask if they want to try again."
-                if self.emitter:
-                    await _safe_run(
-                        self.emitter,
-                        ToolUpdate(
-                                status=Status.ERROR,
-                                tool_call=tool_call.name,
-                                tool_args=kwargs
-                            )
-                    )
-
-            # Record output for LLM
-            self.messages.append({
-                "type": "function_call_output",
-                "call_id": tool_call.call_id,
-                "output": result
-            })
-
-        # If tools ran, re-invoke LLM for natural reply
-        if made_calls:
+        # Wait on any tool calls still running
+        made_calls = bool(tool_tasks)
+        needs_narration = False
+        tool_results = []
+        outcomes = await asyncio.gather(
+            *[task for _, task in tool_tasks], return_exceptions=True
+        )
+        # Record calls and outputs for the LLM, in the order they were made
+        for (tool_call, _), outcome in zip(tool_tasks, outcomes):
+            output, narrate = _record(tool_call, outcome)
+            needs_narration = needs_narration or narrate
+            tool_results.append(output)
+
+        # If tools ran, re-invoke LLM for natural reply, unless the tool results can be used as is
+        if made_calls and not needs_narration:
+            # Keep anything the model already said alongside its tool calls
+            ai_message = "\n".join(
+                text for text in (response.output_text, *tool_results) if text
+            )
+        elif made_calls:
+            # Tools may have changed the state described in the system message, refresh it so the
+            #   reply is written against the current state. The lookups for this user message were
+            #   just made, so they are served from the stores' caches
+            self.messages[0] = {
+                "role": "developer",
+                "content": await self._build_system_message(user_message)
+            }
             try:
-                response = await self.client.responses.create(
+                response = await self._stream_response(
+                    response_id,
+                    on_token,
                     model=self.model,
                     input=self.messages,
                 )
@@ -322,23 +640,27 @@ class BaseAgent:
                             message="Generation failed"
                         )
                     )
-                self.messages.append(
+                self._append_message(
                     {'role': 'assistant', 'content': 'Failed to generate a response'}
                 )
                 return f"OpenAI failed to generate a response: {e}"
 
-        # Parse and finalize the Ai Response
-        ai_message = response.output_text
+            ai_message = response.output_text
+        else:
+            ai_message = response.output_text
+
+        # Finalize the Ai Response
         if self._postchat_func:
             ai_message = await _safe_run(self._postchat_func, self, ai_message)
-        self.messages.append({'role': 'assistant', 'content': ai_message})
+        self._append_message({'role': 'assistant', 'content': ai_message})
 
         if self.emitter:
             await _safe_run(
                 self.emitter,
                 AiUpdate(
                     status=Status.SUCCEDED,
-                    message=ai_message
+                    message=ai_message,
+                    id=response_id
                 )
             )
 
@@ -5,6 +5,7 @@ This allows to creation of a json schema, complete with enums, for different typ
     operations
 """
 
+import functools
 from abc import ABC
 from typing import Literal, Optional, Union
 from pydantic import BaseModel, Field, ConfigDict, create_model
@@ -29,9 +30,11 @@ class _Aggregator(BaseModel, ABC):
     model_config = ConfigDict(discriminator='operator')
 
     @classmethod
+    @functools.lru_cache(maxsize=64)
     def _build_aggregator(cls, fields_enum):
         """
-        Private method to inject Fields Enum into a `column` model field
+        Private method to inject Fields Enum into a `column` model field. Cached per Fields Enum,
+            as `make_enum` returns the same Enum for the same fields
         """
         return create_model(
             cls.__name__.removeprefix('_'),
@@ -1,3 +1,5 @@
+import asyncio
+import functools
 from typing import Type, Union, Sequence, Self, Callable, Optional
 from enum import Enum
 from pydantic import BaseModel, Field, create_model, model_validator
@@ -14,12 +16,14 @@ from geo_assistant.agent.analysis._exceptions import AnalysisSQLStepFailed
 logger = get_logger(__name__)
 
 
+@functools.lru_cache(maxsize=128)
 def make_enum(name: str, *values: Sequence[str]) -> Type[Enum]:
     """
     Dynamically constructs an Enum subclass.
     
     Each member will be named as the upper-cased version of the value,
-    and its `.value` will be the original string.
+    and its `.value` will be the original string. The same name and values always return the
+    same Enum, so the models built from it can be cached by it.
 
     Args:
         name (str): The name of the Enum Class
@@ -74,6 +78,18 @@ class _GISAnalysis(BaseModel):
             Type[Self]: A new class type, that extends itself as a base class, adding the enum
                 restrictions in place of dynamic field descriptors (_DynamicField, _SourceTable)
         """
+        # Building the model compiles a pydantic schema for every step type, which is slow, and
+        #   the same fields and tables come up often. Reuse the model built for them last time
+        return cls._build_model(tuple(fields), tuple(tables), tuple(step_types))
+
+    @classmethod
+    @functools.lru_cache(maxsize=64)
+    def _build_model(
+        cls,
+        fields: tuple[str, ...],
+        tables: tuple[str, ...],
+        step_types: tuple[Type[_GISAnalysisStep], ...],
+    ) -> Type[Self]:
         fields_enum = make_enum("Fields", *fields)
         tables_enum = make_enum("Tables", *tables)
         # generate dynamic versions of each SQLStep subclass
@@ -160,7 +176,61 @@ class _GISAnalysis(BaseModel):
                     setattr(step, field, new_value)
         return self
 
-    async def execute(self, id_: str, engine: Engine, emitter: Callable = None, query: str = None) -> GISReport:
+    def _step_dependencies(self, step: _GISAnalysisStep) -> set[str]:
+        """
+        Returns the tables created by this analysis that the step uses as a source
+        """
+        dependencies = set()
+        for field, info in step.__class__.model_fields.items():
+            ann = info.annotation
+            if isinstance(ann, type) and issubclass(ann, _SourceTable):
+                value: _SourceTable = getattr(step, field)
+                if value.source_schema == self.name:
+                    dependencies.add(str(value))
+        return dependencies
+
+    def _run_step(self, step: _GISAnalysisStep, engine: Engine):
+        """
+        Runs a single step, returning its report item (if any). Blocking, ran in a worker thread
+        """
+        if isinstance(step, _SQLStep):
+            try:
+                item = step._execute(engine, self.name)
+                self.tables_created.append(f"{self.name}.{step.output_table}")
+                return item
+            except Exception as e:
+                raise AnalysisSQLStepFailed(
+                    analysis_name=self.name,
+                    step=step,
+                    exception=e
+                )
+        # TODO: If any more reporting steps get added, new logic will need to be implemented
+        #   here
+        elif isinstance(step, _PlotlyMapLayerStep):
+            return step.export()
+        return None
+
+    def _create_schema(self, engine: Engine) -> None:
+        """
+        Creates the analysis schema, if it does not exist, and grants pg-tileserv access to it
+        """
+        with engine.begin() as conn:
+            sql = text(
+                (
+                    f"CREATE SCHEMA IF NOT EXISTS {self.name} AUTHORIZATION {Configuration.db_tileserv_role};"
+                    f"GRANT USAGE ON SCHEMA {self.name} TO {Configuration.db_tileserv_role};"
+                )
+            )
+            conn.execute(sql)
+
+    async def execute(
+        self,
+        id_: str,
+        engine: Engine,
+        emitter: Callable = None,
+        query: str = None,
+        on_item: Callable = None,
+    ) -> GISReport:
         """
         Executes the pregenerated plan. This will populate a new schema in the database, filled
             with any tables that this particular analysis used. It returns a strucutred "GISReport"
@@ -169,53 +239,71 @@ class _GISAnalysis(BaseModel):
         
         Args:
             engine (sqlalchemy.Engine): A sqlalchemy engine to be used to run the query.
+            on_item (Callable): Optional coroutine function, awaited with each report item as soon
+                as its step finishes, so callers can act on items while later steps still run
         
         Returns:
             GISReport: A pydantic model containing all the results from each step in the analysis
         """
 
         # Create the new schema (if it doesnt exists already) and grant pg-tileserv permissions to
-        #   use it
-        with engine.begin() as conn:
-            sql = text(
-                (
-                    f"CREATE SCHEMA IF NOT EXISTS {self.name} AUTHORIZATION {Configuration.db_tileserv_role};"
-                    f"GRANT USAGE ON SCHEMA {self.name} TO {Configuration.db_tileserv_role};"
-                )
-            )
-            conn.execute(sql)
+        #   use it. Kept off the event loop, like the steps themselves
+        await asyncio.to_thread(self._create_schema, engine)
 
-        items = []
-        # Run each step, saving result to the 'items' array
-        for i, step in enumerate(self.steps):
-            logger.info(f"Running {step.name}: {step.reasoning}")
-            if emitter:
-                await emitter(
-                    {
-                        "type": "analysis",
-                        "query": query,
-                        "step": step.reasoning,
-                        "id": id_,
-                        "status": "processing",
-                        "progress": float(i+1)/len(self.steps)
-                    }
-                )
+        # Steps only depend on the tables output by the steps before them. Run the steps in
+        #   waves, where every step in a wave has all of its source tables already created, so
+        #   independent branches of the plan run concurrently
+        results = {}
+        created: set[str] = set()
+        pending = list(enumerate(self.steps))
+        while pending:
+            wave = [
+                (i, step) for i, step in pending
+                if self._step_dependencies(step) <= created
+            ]
+            if not wave:
+                # Should not happen for a valid plan, run the next step on its own and let it fail
+                wave = pending[:1]
 
-            if isinstance(step, _SQLStep):
-                try:
-                    items.append(step._execute(engine, self.name))
-                    self.tables_created.append(f"{self.name}.{step.output_table}")
-                except Exception as e:
-                    raise AnalysisSQLStepFailed(
-                        analysis_name=self.name,
-                        step=step,
-                        exception=e
+            for i, step in wave:
+                logger.info(f"Running {step.name}: {step.reasoning}")
+                if emitter:
+                    await emitter(
+                        {
+                            "type": "analysis",
+                            "query": query,
+                            "step": step.reasoning,
+                            "id": id_,
+                            "status": "processing",
+                            "progress": float(i+1)/len(self.steps)
+                        }
                     )
-            # TODO: If any more reporting steps get added, new logic will need to be implemented
-            #   here
-            elif isinstance(step, _PlotlyMapLayerStep):
-                items.append(step.export())
-            
+
+            # Let the whole wave settle before raising, so no step is still creating tables in
+            #   its thread while the caller cleans up after a failure
+            wave_results = await asyncio.gather(*[
+                asyncio.to_thread(self._run_step, step, engine)
+                for _, step in wave
+            ], return_exceptions=True)
+            failure = None
+            for (i, step), result in zip(wave, wave_results):
+                if isinstance(result, BaseException):
+                    failure = failure or result
+                    continue
+                results[i] = result
+                if isinstance(step, _SQLStep):
+                    created.add(f"{self.name}.{step.output_table}")
+                if on_item and result is not None:
+                    await on_item(result)
+            if failure:
+                raise failure
+            pending = [(i, step) for i, step in pending if i not in results]
+
+        # Report items stay in the order of the steps
+        items = [
+            results[i] for i in range(len(self.steps))
+            if results[i] is not None
+        ]
         return GISReport(
             items=items
         )
\ No newline at end of file
@@ -5,6 +5,7 @@ This allows to creation of a json schema, complete with enums, for different typ
     operations
 """
 
+import functools
 from abc import ABC
 from typing import Union, List
 from typing_extensions import Literal
@@ -34,9 +35,11 @@ class _FilterItem(BaseModel, ABC):
     model_config = ConfigDict(discriminator='operator')
 
     @classmethod
+    @functools.lru_cache(maxsize=64)
     def _build_filter(cls, fields_enum):
         """
-        Private method to inject Fields Enum into a `column` model field
+        Private method to inject Fields Enum into a `column` model field. Cached per Fields Enum,
+            as `make_enum` returns the same Enum for the same fields
         """
         return create_model(
             cls.__name__.removeprefix('_'),
@@ -18,12 +18,12 @@ from abc import ABC, abstractmethod
 from typing import Type, Self, Literal, Optional, Union
 from pydantic import BaseModel, Field, create_model, model_validator
 from pydantic.json_schema import SkipJsonSchema
-from sqlalchemy import Engine, text
+from sqlalchemy import Engine
 
 from geo_assistant.logging import get_logger
 
 from geo_assistant.config import Configuration
-from geo_assistant._sql._sql_exec import execute_template_sql
+from geo_assistant._sql._sql_exec import execute_template_sql, execute_template_sql_batch
 from geo_assistant.agent.analysis.report import PlotlyMapLayerArguements, TableCreated, SaveTable
 from geo_assistant.agent.analysis._filter import SQLFilters, _FilterItem
 from geo_assistant.agent.analysis._aggregator import SQLAggregators, _Aggregator
@@ -152,11 +152,10 @@ class _SQLStep(_GISAnalysisStep, ABC):
         self,
         engine: Engine,
         geometry_column: str = Configuration.geometry_column,
-    ) -> None:
+    ) -> str:
         """
-        Scans the specified table for existing geometry subtypes, selects an
-        appropriate Multi* typmod (or GeometryCollection), and normalizes the
-        geometry column so that all rows share the same type and SRID.
+        Finds the geometry subtypes across the step's source tables, and selects an
+        appropriate Multi* typmod (or GeometryCollection) that all of them fit into.
 
         Args:
             engine (Engine): SQLAlchemy Engine connected to your PostGIS database
@@ -169,30 +168,16 @@ class _SQLStep(_GISAnalysisStep, ABC):
             if issubclass(f.annotation, _SourceTable):
                 tables.append(getattr(self, name))
 
-        # Helper function to decide with geometry
-        def choose_typmod(types: set[str]) -> str:
-            poly = {'POLYGON', 'MULTIPOLYGON'}
-            line = {'LINESTRING', 'MULTILINESTRING'}
-            point = {'POINT', 'MULTIPOINT'}
-            if types <= poly:
-                return 'MultiPolygon'
-            if types <= line:
-                return 'MultiLineString'
-            if types <= point:
-                return 'MultiPoint'
-            return 'GeometryCollection'
-
-        with engine.begin() as conn:
-            # Gather distinct geometry types
-            results = [
-                conn.execute(
-                    text(f'SELECT DISTINCT GeometryType({geometry_column}) FROM "{table.source_schema}"."{table.source_table}"')
-                )
-                for table in tables
-            ]
-            geom_types = {row[0] for result in results for row in result}
-            # Choose the target typmod
-            return choose_typmod(geom_types)
+        # Detect the types and choose the typmod in the database, so only the chosen typmod comes
+        #   back. Source tables with a typed geometry column are answered from the catalog
+        #   without scanning their rows
+        rows = execute_template_sql(
+            template_name="geometry_typmod",
+            engine=engine,
+            tables=tables,
+            geometry_column=geometry_column,
+        )
+        return rows[0]["typmod"]
 
 
     def _execute(self, engine: Engine, schema: str, gtype: str = None) -> TableCreated:
@@ -210,21 +195,28 @@ class _SQLStep(_GISAnalysisStep, ABC):
         # Build out the args, excluding ones that are not needed
         exclude_args = ['_type', '_is_intermediate']
         other_args = self.model_dump(exclude=exclude_args)
-        execute_template_sql(
+        # Create and postprocess the table in a single round-trip
+        execute_template_sql_batch(
             engine=engine,
-            template_name=self.step_type,
-            geometry_column=Configuration.geometry_column,
-            srid=3857,
-            gtype=gtype,
-            schema=schema,
-            **other_args
-        )
-
-        execute_template_sql(
-            engine=engine,
-            template_name="postprocess",
-            schema=schema,
-            table=self.output_table
+            templates=[
+                (
+                    self.step_type,
+                    dict(
+                        geometry_column=Configuration.geometry_column,
+                        srid=3857,
+                        gtype=gtype,
+                        schema=schema,
+                        **other_args
+                    )
+                ),
+                (
+                    "postprocess",
+                    dict(
+                        schema=schema,
+                        table=self.output_table
+                    )
+                ),
+            ]
         )
 
         # Return a `TableCreated` reporting item
@@ -18,6 +18,17 @@ class EmitUpdate(BaseModel):
 class AiUpdate(EmitUpdate):
     type: Literal['ai_response'] = 'ai_response'
     message: str = None
+    id: str = None
+
+
+class AiDeltaUpdate(EmitUpdate):
+    """
+    A piece of an ai response, sent as the response is being streamed. The final `AiUpdate` with
+        the same `id` replaces all of the deltas
+    """
+    type: Literal['ai_delta'] = 'ai_delta'
+    id: str
+    delta: str
 
 
 class ToolUpdate(EmitUpdate):
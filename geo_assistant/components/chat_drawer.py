@@ -156,6 +156,22 @@ class ChatDrawer(dbc.Offcanvas):
                     p for p in (store or [])
                     if not (p.get("type")=="analysis" and str(p.get("id"))==uid)
                 ]
+            elif typ == "ai_delta":
+                # streamed pieces of a response are appended onto the same message
+                uid = str(payload["id"])
+                previous = next(
+                    (p for p in (store or []) if p.get("type")=="ai_delta" and p.get("uid")==uid),
+                    None
+                )
+                payload["message"] = (previous["message"] if previous else "") + payload["delta"]
+                store = [p for p in (store or []) if p is not previous]
+            elif typ == "ai_response" and payload.get("id"):
+                # the final response replaces any streamed pieces of it
+                uid = str(payload["id"])
+                store = [
+                    p for p in (store or [])
+                    if not (p.get("type")=="ai_delta" and p.get("uid")==uid)
+                ]
             else:
                 # brand-new for user/assistant/other
                 uid = str(uuid.uuid4())
@@ -189,7 +205,7 @@ class ChatDrawer(dbc.Offcanvas):
                             id=uid,
                         )
                     )
-                elif typ in ("ai_response","assistant_message"):
+                elif typ in ("ai_response","ai_delta","assistant_message"):
                     children.append(
                         gac.AssistantMessage(
                             p.get("message",""),
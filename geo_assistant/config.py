@@ -4,16 +4,35 @@ from pydantic import Field
 class DefaultConfiguration(BaseSettings):
     # OpenAI Configuration
     openai_key: str = Field(default='no-key')
+    openai_max_connections: int = Field(default=50)
+    openai_max_concurrent_requests: int = Field(default=20)
+    openai_requests_per_minute: int = Field(default=500)
+    openai_tokens_per_minute: int = Field(default=200000)
     parsing_model: str = Field(default="o4-mini")
+    parsing_concurrency: int = Field(default=4)
     inference_model: str = Field(default="gpt-4o")
+    max_history_tokens: int = Field(default=8000)
     embedding_model: str = Field(default="text-embedding-3-small")
     embedding_dims: int = Field(default=1536)
+    embedding_batch_size: int = Field(default=256)
+    embedding_concurrency: int = Field(default=5)
+    embedding_cache_max_rows: int = Field(default=100000)
+    faiss_omp_threads: int = Field(default=8)
+    docstore_index_factory: str = Field(default="HNSW32,SQ8,RFlat")
+    docstore_refine_k_factor: int = Field(default=4)
+    docstore_hnsw_ef_construction: int = Field(default=64)
+    docstore_hnsw_ef_search: int = Field(default=40)
+    docstore_use_gpu: bool = Field(default=True)
+    semantic_cache_size: int = Field(default=256)
+    semantic_cache_threshold: float = Field(default=0.95)
+    semantic_cache_ttl: float = Field(default=300.0)
 
     # App Configuration
     docstore_path: str = Field(default="./docstore")
     field_def_store_version: str = Field(default="1.0.9")
     info_store_version: str = Field(default="1.0.8")
     pg_tileserv_url: str = Field(default="http://127.0.0.1:7800")
+    registry_ttl_s: float = Field(default=30.0)
     default_table: str = Field(default="pluto")
     log_level: str = Field(default="INFO")
     map_box_style: str = Field(default="carto-darkmatter")
@@ -24,6 +43,8 @@ class DefaultConfiguration(BaseSettings):
     db_password: str = Field(default="pw")
     db_port: int = Field(default=5432)
     db_connection_url: str = Field(default="")
+    db_pool_size: int = Field(default=10)
+    db_max_overflow: int = Field(default=10)
     db_base_schema: str = Field(default="base")
     db_tileserv_role: str = Field(default="pg_database_owner")
     
@@ -1,14 +1,28 @@
+import os
 import faiss
-import openai
+import asyncio
+import hashlib
+import pypdfium2 as pdfium
+import sqlite3
 import pathlib
-import json
+import threading
+import orjson
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import feather
 
 from abc import ABC
+from typing import Union, Any
+from concurrent.futures import ProcessPoolExecutor
 from pydantic import BaseModel
 
 from geo_assistant.config import Configuration
+from geo_assistant._openai import get_async_client, _PerLoop
+from geo_assistant.doc_stores._semantic_cache import SemanticCache
 
+# FAISS defaults to every core, which scales poorly for flat indexes on large machines
+faiss.omp_set_num_threads(min(Configuration.faiss_omp_threads, os.cpu_count() or 1))
 
 
 KEY_TERMS_SYSTEM_MESSAGE = """
@@ -20,19 +34,78 @@ Here is some context to provide more guidance:
 {context}
 """
 
+# Embedding requests in flight, by cache key, for each event loop. Shared across stores, so
+#   concurrent lookups of the same text (e.g. one user message queried against every store at
+#   once) make a single request
+_pending_embeddings: _PerLoop = _PerLoop(dict)
+
+
 class SearchQuery(BaseModel):
     terms: list[str]
 
 
+def _extract_page_range(pdf_path: str, start: int, end: int) -> list[str]:
+    """
+    Extracts the text of pages [start, end) of a pdf. Runs in a worker process, as PDFium is not
+        thread-safe, so each worker opens its own copy of the document
+    """
+    pdf = pdfium.PdfDocument(pdf_path)
+    try:
+        return [
+            pdf[i].get_textpage().get_text_range()
+            for i in range(start, end)
+        ]
+    finally:
+        pdf.close()
+
+
+async def extract_pdf_pages(
+    pdf_path: Union[str, pathlib.Path],
+    start_page: int = None,
+    end_page: int = None,
+) -> list[str]:
+    """
+    Extracts the text of each page in a pdf using PDFium, splitting the pages across a pool of
+        worker processes
+
+    Args:
+        pdf_path (Union[str, pathlib.Path]): Path to the pdf
+        start_page (int): First page to extract. Defaults to the first page
+        end_page (int): Page to stop extracting at (exclusive). Defaults to the last page
+    Returns:
+        list[str]: The text of each page, prefixed with its page number
+    """
+    pdf_path = str(pdf_path)
+    pdf = pdfium.PdfDocument(pdf_path)
+    n_pages = len(pdf)
+    pdf.close()
+
+    start, end, _ = slice(start_page, end_page).indices(n_pages)
+    if start >= end:
+        return []
+    n_workers = min(os.cpu_count() or 1, end - start)
+    chunk_size = -(-(end - start) // n_workers)
+
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        chunks = await asyncio.gather(*[
+            loop.run_in_executor(pool, _extract_page_range, pdf_path, i, min(i + chunk_size, end))
+            for i in range(start, end, chunk_size)
+        ])
+    texts = [text for chunk in chunks for text in chunk]
+    return [f"## Page {start + i + 1}\n{text}" for i, text in enumerate(texts)]
+
+
 class DocumentStore(ABC):
     """
-    Generic FAISS + JSON store base.
+    Generic FAISS + Arrow store base. Documents are kept in a columnar Arrow table whose rows
+        match the vectors in the FAISS index.
     Subclasses must define:
       - self.parse_prompt  (str)
       - self.parse_model   (pydantic model type)
       - self.index_dirname (str)
     """
-    _client = openai.AsyncOpenAI(api_key=Configuration.openai_key)
+    _client = get_async_client()
     _name = "base"
 
     def __init__(
@@ -53,119 +126,410 @@ class DocumentStore(ABC):
         if idx_file.exists():
             self.index = faiss.read_index(str(idx_file))
         else:
-            # new empty FlatIP + IDMap
-            base = faiss.IndexFlatIP(self.vector_dim)
-            self.index = faiss.IndexIDMap(base)
+            # new empty index, vectors are normalized so IP == cosine similarity. Defaults to an
+            #   HNSW graph over int8 scalar quantized vectors (a quarter of the bytes of fp32),
+            #   with the top candidates re-ranked against the full precision vectors
+            self.index = faiss.downcast_index(faiss.index_factory(
+                self.vector_dim,
+                Configuration.docstore_index_factory,
+                faiss.METRIC_INNER_PRODUCT
+            ))
+            if isinstance(self.index, faiss.IndexRefine):
+                # Number of candidates re-ranked per result
+                self.index.k_factor = Configuration.docstore_refine_k_factor
+            if (hnsw := self._hnsw_index()) is not None:
+                # Only used while building the graph, so only needs setting on new indexes
+                hnsw.hnsw.efConstruction = Configuration.docstore_hnsw_ef_construction
+        if (hnsw := self._hnsw_index()) is not None:
+            # Width of the graph search, trading recall for speed
+            hnsw.hnsw.efSearch = Configuration.docstore_hnsw_ef_search
 
-        # ------ Load or init document map ----------
-        docs_file = self.export_path / "documents.json"
+        # ------ Load or init document table ----------
+        # Documents are stored column-wise by position, so a FAISS result index is the document's
+        #   row in the table
+        docs_file = self.export_path / "documents.feather"
+        legacy_docs_file = self.export_path / "documents.json"
         if docs_file.exists():
-            raw = json.loads(docs_file.read_text())
-            self.documents = {int(k):v for k,v in raw.items()}
+            self.documents: pa.Table = feather.read_table(docs_file)
+        elif legacy_docs_file.exists():
+            raw = orjson.loads(legacy_docs_file.read_bytes())
+            if isinstance(raw, dict):
+                raw = self._migrate_id_map(raw)
+            self.documents: pa.Table = pa.Table.from_pylist(raw)
         else:
-            self.documents = {}
+            self.documents: pa.Table = pa.table({})
+
+        # ------ Move the index onto a GPU if one is available ----------
+        self._gpu_resources = None
+        if Configuration.docstore_use_gpu and faiss.get_num_gpus() > 0:
+            gpu_resources = faiss.StandardGpuResources()
+            try:
+                self.index = faiss.index_cpu_to_gpu(gpu_resources, 0, self.index)
+                self._gpu_resources = gpu_resources
+            except RuntimeError:
+                # Not every index type has a GPU implementation, stay on the CPU for those
+                pass
+
+        # ------ Open the on-disk embedding cache ----------
+        # Read and written from worker threads, so the event loop never waits on the disk. The lock
+        #   serializes access to the shared connection
+        self._embed_cache = sqlite3.connect(
+            self.export_path / "embed_cache.sqlite", check_same_thread=False
+        )
+        self._embed_cache_lock = threading.Lock()
+        self._embed_cache.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vec BLOB)"
+        )
+
+        # ------ Cache of recent query results, matched by query similarity ----------
+        self._query_cache = SemanticCache(
+            dim=self.vector_dim,
+            size=Configuration.semantic_cache_size,
+            threshold=Configuration.semantic_cache_threshold,
+            ttl=Configuration.semantic_cache_ttl,
+        )
+        # Search terms generated by `smart_query`, keyed by a hash of its inputs
+        self._terms_cache: dict[bytes, list[str]] = {}
+        # Document positions by column value, per column looked up by `get_docs_by_kv`
+        self._kv_index: dict[str, dict[Any, list[int]]] = {}
+
+    def _hnsw_index(self) -> Union[faiss.IndexHNSW, None]:
+        """
+        Returns the HNSW index the store searches, unwrapping a refine index, or None if the
+            store does not use HNSW
+        """
+        index = self.index
+        if isinstance(index, faiss.IndexRefine):
+            index = faiss.downcast_index(index.base_index)
+        return index if isinstance(index, faiss.IndexHNSW) else None
+
+    def _migrate_id_map(self, raw: dict[str, dict]) -> list[dict]:
+        """
+        Converts a store saved with an `IndexIDMap` (documents keyed by id) into the positional
+            layout, unwrapping the index so that positions are the ids
+        """
+        if isinstance(self.index, faiss.IndexIDMap):
+            ids = faiss.vector_to_array(self.index.id_map)
+            self.index = faiss.downcast_index(self.index.index)
+            return [raw[str(id_)] for id_ in ids]
+        return list(raw.values())
+
+    def _embed_cache_key(self, text: str) -> bytes:
+        """
+        Key for the embedding cache, unique to the embedding model + text
+        """
+        return hashlib.sha256((self.embedding_model + "\x00" + text).encode("utf-8")).digest()
+
+    def _get_cached_embeddings(self, keys: list[bytes]) -> dict[bytes, np.ndarray]:
+        """
+        Looks up any previously computed embeddings for the given cache keys
+        """
+        cached = {}
+        with self._embed_cache_lock:
+            # Chunk the lookup to stay under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i : i + 500]
+                rows = self._embed_cache.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                for key, vec in rows:
+                    cached[key] = np.frombuffer(vec, dtype="float32")
+        return cached
+
+    def _put_cached_embeddings(self, embeddings: dict[bytes, np.ndarray]):
+        """
+        Saves new embeddings to the cache, evicting the oldest once it holds more than
+            `Configuration.embedding_cache_max_rows`
+        """
+        with self._embed_cache_lock, self._embed_cache:
+            self._embed_cache.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                [(key, emb.tobytes()) for key, emb in embeddings.items()]
+            )
+            # Replaced rows are re-inserted with a new rowid, so the newest rows always have the
+            #   highest rowids
+            self._embed_cache.execute(
+                "DELETE FROM embeddings WHERE rowid <= (SELECT max(rowid) FROM embeddings) - ?",
+                (Configuration.embedding_cache_max_rows,)
+            )
+
+    async def _embed(self, texts: list[str]) -> np.ndarray:
+        """
+        Embed a list of texts. Texts that were embedded before are read from the on-disk cache,
+            and texts another call is already embedding wait on that request. The rest are
+            embedded by `_fetch_embeddings`.
+
+        Args:
+            texts(list[str]): The texts to embed
+        Returns:
+            np.ndarray: L2-normalized float32 embeddings, in the same order as `texts`
+        """
+        keys = [self._embed_cache_key(text) for text in texts]
+        cached = await asyncio.to_thread(self._get_cached_embeddings, keys)
+
+        # Only hit OpenAI for texts that have not been embedded, or are not being embedded already
+        pending: dict[bytes, asyncio.Task] = _pending_embeddings.get()
+        new = {
+            key: text
+            for key, text in zip(keys, texts)
+            if key not in cached and key not in pending
+        }
+        if new:
+            # Requests run as their own task, so cancelling one caller does not cancel the request
+            #   for every other caller waiting on it
+            task = asyncio.create_task(self._fetch_embeddings(new))
+            pending.update(dict.fromkeys(new, task))
+
+            def _done(task: asyncio.Task, keys=tuple(new)):
+                for key in keys:
+                    if pending.get(key) is task:
+                        del pending[key]
+                # Mark any failure as retrieved, each caller waiting on it raises it themselves
+                if not task.cancelled():
+                    task.exception()
 
-    
-    async def add(self, documents: list[dict], index_key: str, text_key: str):
+            task.add_done_callback(_done)
+
+        requests = {pending[key] for key in keys if key not in cached}
+        for request in requests:
+            cached.update(await asyncio.shield(request))
+
+        return np.array([cached[key] for key in keys], dtype="float32")
+
+    async def _fetch_embeddings(self, texts: dict[bytes, str]) -> dict[bytes, np.ndarray]:
+        """
+        Embeds texts with OpenAI and saves them to the cache. Texts are split into fixed-size
+            batches that are sent concurrently, capped by `Configuration.embedding_concurrency`
+            in-flight requests.
+
+        Args:
+            texts(dict[bytes, str]): The texts to embed, by cache key
+        Returns:
+            dict[bytes, np.ndarray]: L2-normalized float32 embeddings, by cache key
+        """
+        semaphore = asyncio.Semaphore(Configuration.embedding_concurrency)
+
+        async def _embed_batch(batch: list[str]) -> list[list[float]]:
+            async with semaphore:
+                resp = await self._client.embeddings.create(
+                    model=self.embedding_model,
+                    input=batch
+                )
+            return [item.embedding for item in resp.data]
+
+        miss_texts = list(texts.values())
+        batch_size = Configuration.embedding_batch_size
+        # gather preserves order, so batches can be flattened straight back out
+        results = await asyncio.gather(*[
+            _embed_batch(miss_texts[i : i + batch_size])
+            for i in range(0, len(miss_texts), batch_size)
+        ])
+        new_embs = np.array([emb for batch in results for emb in batch], dtype="float32")
+        faiss.normalize_L2(new_embs)
+
+        embeddings = dict(zip(texts, new_embs))
+        await asyncio.to_thread(self._put_cached_embeddings, embeddings)
+        return embeddings
+
+    async def add(self, documents: list[dict], text_key: str):
         """
         Add multiple documents to the FAISS index and in-memory store, then persist both.
 
         Args:
-            documents(list[dict]):  A list of dicts, each containing at least the ID and the text to embed.
-            index_key(str):  The key in each dict whose value is the integer ID.
+            documents(list[dict]):  A list of dicts, each containing at least the text to embed.
             text_key(str):   The key in each dict whose value is the text to embed.
         """
-        # Extract IDs and texts
-        ids   = [doc[index_key] for doc in documents]
-        texts = [doc[text_key]       for doc in documents]
+        texts = [doc[text_key] for doc in documents]
 
-        # Batch‐embed all texts in one call
-        resp = await self._client.embeddings.create(
-            model=Configuration.embedding_model,
-            input=texts
-        )
-        # Load embeddings into numpy
-        embs = np.array([item.embedding for item in resp.data], dtype="float32")
+        # Batch‐embed all texts, normalized and ready for FAISS
+        embs = await self._embed(texts)
 
-        # Normalize and add to FAISS in one shot
-        faiss.normalize_L2(embs)
-        self.index.add_with_ids(embs, np.array(ids, dtype="int64"))
+        # Quantized indexes need training before vectors can be added (no-op for fp16)
+        if not self.index.is_trained:
+            self.index.train(embs)
+        # Add to FAISS in one shot, new vectors are appended so positions line up with documents
+        self.index.add(embs)
+        # Cached results may no longer be the closest documents
+        self._query_cache.clear()
+        self._kv_index.clear()
 
-        # Update in‐memory document map
-        for doc_id, doc in zip(ids, documents):
-            # drop the raw text if you prefer
-            meta = {k: v for k, v in doc.items() if k != text_key}
-            self.documents[doc_id] = meta
+        # Update in‐memory document table
+        new_documents = pa.Table.from_pylist([
+            {k: v for k, v in doc.items() if k != text_key}
+            for doc in documents
+        ])
+        if self.documents.num_rows:
+            self.documents = pa.concat_tables(
+                [self.documents, new_documents],
+                promote_options="default"
+            )
+        else:
+            self.documents = new_documents
 
         # Persist both index and documents
         self._export()
 
 
     async def smart_query(self, text: str, conversation: str, context: str, k: int=5):
-        res = await self._client.responses.parse(
-            input=[
-                {'role': 'developer', 'content': KEY_TERMS_SYSTEM_MESSAGE.format(context=context)},
-                {'role': 'user', 'content': json.dumps({'conversation': conversation, 'query': text}, indent=2)}
-            ],
-            text_format=SearchQuery,
-            model="gpt-4o"
-        )
-
-        terms = res.output_parsed.terms
+        # Generating the search terms is an LLM call, reuse the terms for identical inputs
+        terms_key = hashlib.sha256(
+            "\x00".join((text, conversation, context)).encode("utf-8")
+        ).digest()
+        terms = self._terms_cache.get(terms_key)
+        if terms is None:
+            res = await self._client.responses.parse(
+                input=[
+                    {'role': 'developer', 'content': KEY_TERMS_SYSTEM_MESSAGE.format(context=context)},
+                    {'role': 'user', 'content': orjson.dumps({'conversation': conversation, 'query': text}, option=orjson.OPT_INDENT_2).decode()}
+                ],
+                text_format=SearchQuery,
+                model="gpt-4o"
+            )
+            terms = res.output_parsed.terms
+            if len(self._terms_cache) >= Configuration.semantic_cache_size:
+                # Evict the oldest entry
+                del self._terms_cache[next(iter(self._terms_cache))]
+            self._terms_cache[terms_key] = terms
 
         total_results = []
-        
-        for term in terms:
-            term_results = await self.query(term)
+        seen_names = set()
+
+        # Search all terms in a single batch
+        for term_results in await self.query_many(terms):
             for res in term_results:
-                if res['name'] not in [r['name'] for r in total_results]:
+                if res['name'] not in seen_names:
+                    seen_names.add(res['name'])
                     total_results.append(res)
         return total_results
 
 
-    async def query(self, text: str, k: int=5) -> list[dict]:
+    async def query(
+        self,
+        text: str,
+        k: int=5,
+        do_not_cache: bool=False,
+        subset: np.ndarray=None
+    ) -> list[dict]:
         """
         Query the DocumentStore to recieve top k results
 
         Args:
             text(str): The user's query, text to be matched against
             k(int): Returns top k documents. Defaults to 5.
+            do_not_cache(bool): Skip the semantic query cache. Defaults to False.
+            subset(np.ndarray): Positions of the only documents to search. Defaults to all.
         Returns:
             list[dict]: Top k closest documents with distances
         """
-        # Embed and normalize
-        resp = await self._client.embeddings.create(
-            model=self.embedding_model,
-            input=[text]
-        )
-        vec = np.array(resp.data[0].embedding, dtype="float32").reshape(1, -1)
-        faiss.normalize_L2(vec)
+        return (await self.query_many([text], k=k, do_not_cache=do_not_cache, subset=subset))[0]
 
+    async def query_many(
+        self,
+        texts: list[str],
+        k: int=5,
+        do_not_cache: bool=False,
+        subset: np.ndarray=None
+    ) -> list[list[dict]]:
+        """
+        Query the DocumentStore with multiple texts at once, using one embedding call and one
+            index search for the whole batch. Queries similar enough to a recent query are served
+            from the semantic query cache instead of the index.
+
+        Args:
+            texts(list[str]): The queries, texts to be matched against
+            k(int): Returns top k documents per query. Defaults to 5.
+            do_not_cache(bool): Skip the semantic query cache. Defaults to False.
+            subset(np.ndarray): Positions of the only documents to search, all others are skipped
+                without being scored. Searches over a subset are not cached. Defaults to all.
+        Returns:
+            list[list[dict]]: Top k closest documents with distances, one list per query
+        """
+        if not texts:
+            return []
+
+        if subset is not None or do_not_cache:
+            # Embed and normalize (served from the embedding cache for repeated queries)
+            vecs = np.ascontiguousarray(await self._embed(texts))
+            return self._search(vecs, k, subset=subset)
+
+        # Repeated queries are served straight from the cache, without being embedded
+        results = [self._query_cache.get_exact(text, k) for text in texts]
+        pending = [i for i, res in enumerate(results) if res is None]
+        if not pending:
+            return results
+
+        vecs = np.ascontiguousarray(await self._embed([texts[i] for i in pending]))
+        # Then similar queries, only searching the index for the rest
+        misses = []
+        for row, (i, vec) in enumerate(zip(pending, vecs)):
+            results[i] = self._query_cache.get(vec, k)
+            if results[i] is None:
+                misses.append((i, row))
+        if misses:
+            miss_vecs = vecs[[row for _, row in misses]]
+            for (i, _), vec, res in zip(misses, miss_vecs, self._search(miss_vecs, k)):
+                self._query_cache.put(vec, k, res, text=texts[i])
+                results[i] = res
+        return results
+
+    def _search(self, vecs: np.ndarray, k: int, subset: np.ndarray=None) -> list[list[dict]]:
+        """
+        Searches the index for a batch of embeddings and gathers the matching documents
+        """
         # Search the index
-        D, I = self.index.search(vec, k)
-        # Tie back up with the documents
-        out = []
-        for dist, idx in zip(D[0], I[0]):
-            doc = self.documents.get(idx, {}).copy()
+        if subset is None:
+            D, I = self.index.search(vecs, k)
+        else:
+            selector = faiss.IDSelectorBatch(np.ascontiguousarray(subset, dtype="int64"))
+            if (hnsw := self._hnsw_index()) is not None:
+                # Passing parameters replaces the index's own, so keep the search width
+                params = faiss.SearchParametersHNSW(sel=selector, efSearch=hnsw.hnsw.efSearch)
+            else:
+                params = faiss.SearchParameters(sel=selector)
+            if isinstance(self.index, faiss.IndexRefine):
+                # Refine indexes take their own parameters, wrapping those for the coarse search
+                params = faiss.IndexRefineSearchParameters(
+                    k_factor=self.index.k_factor,
+                    base_index_params=params
+                )
+            D, I = self.index.search(vecs, k, params=params)
+        # Tie back up with the documents, gathering the whole batch with a single take
+        # FAISS pads with -1 when there are fewer than k documents
+        found = I >= 0
+        docs = self.documents.take(pa.array(I[found])).to_pylist()
+        for doc, dist in zip(docs, D[found].tolist()):
             # Add distance to the results
-            doc["distance"] = float(dist)
-            out.append(doc)
-        return out
+            doc["distance"] = dist
+        # Split the flat list back up per query
+        bounds = np.cumsum(found.sum(axis=1))[:-1].tolist()
+        starts = [0] + bounds
+        ends = bounds + [len(docs)]
+        return [docs[start:end] for start, end in zip(starts, ends)]
 
     def _export(self):
         """
         Private method to export the index and documents. Be careful when calling.
         """
-        faiss.write_index(self.index,      str(self.export_path / "index.bin"))
-        (self.export_path/"documents.json").write_text(
-            json.dumps(self.documents, indent=2)
+        index = faiss.index_gpu_to_cpu(self.index) if self._gpu_resources else self.index
+        faiss.write_index(index,           str(self.export_path / "index.bin"))
+        # Uncompressed so the file can be memory-mapped straight back in
+        feather.write_feather(
+            self.documents,
+            str(self.export_path / "documents.feather"),
+            compression="uncompressed"
         )
 
 
     def get_docs_by_kv(self, key: str, value: str):
-        results = [
-            doc
-            for doc in self.documents.values()
-            if doc[key] == value
-        ]
-        return results
\ No newline at end of file
+        # Positions of each value of the column, built on the first lookup of a key so repeated
+        #   lookups (e.g. one per filter) do not rescan the column
+        if key not in self._kv_index:
+            positions: dict[Any, list[int]] = {}
+            for i, v in enumerate(self.documents[key].to_pylist()):
+                positions.setdefault(v, []).append(i)
+            self._kv_index[key] = positions
+        rows = self._kv_index[key].get(value)
+        if not rows:
+            return []
+        return self.documents.take(pa.array(rows)).to_pylist()
\ No newline at end of file
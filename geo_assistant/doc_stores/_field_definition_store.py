@@ -1,14 +1,15 @@
 import pathlib
-import json
+import orjson
 import asyncio
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
 from typing import Union, List, Any, Dict, Literal
 from pydantic import BaseModel, Field
 
-from PyPDF2 import PdfReader, PageObject
-
 from geo_assistant.logging import get_logger
 from geo_assistant.config import Configuration
-from geo_assistant.doc_stores._base import DocumentStore
+from geo_assistant.doc_stores._base import DocumentStore, extract_pdf_pages
 
 logger = get_logger(__name__)
 
@@ -74,6 +75,21 @@ class FieldDefinitionStore(DocumentStore):
     _name = "field_definitions"
     _parse_prompt   = PARSE_SYSTEM_MESSAGE
 
+    def positions_for_names(self, names: set[str]) -> np.ndarray:
+        """
+        Finds the positions of every field definition whose name (case-insensitive) is in
+            `names`. Used to restrict a query to only the fields that actually exist
+
+        Args:
+            names (set[str]): Field names to search for
+        Returns:
+            np.ndarray: Positions of the matching documents in the store
+        """
+        if not self.documents.num_rows:
+            return np.array([], dtype="int64")
+        lowered = pc.utf8_lower(self.documents["name"])
+        mask = pc.is_in(lowered, value_set=pa.array([name.lower() for name in names]))
+        return np.flatnonzero(mask.to_numpy(zero_copy_only=False))
 
     async def add_pdf(
         self,
@@ -90,44 +106,43 @@ class FieldDefinitionStore(DocumentStore):
         self.table = table
         # Read & split PDF text
         pdf_path = pathlib.Path(pdf_path)
-        reader   = PdfReader(pdf_path)
-
-        if start_page and end_page:
-            pages = reader.pages[start_page:end_page]
-        elif start_page:
-            pages = reader.pages[start_page:]
-        elif end_page:
-            pages = reader.pages[:end_page]
-        else:
-            pages= reader.pages
+        pages    = await extract_pdf_pages(pdf_path, start_page, end_page)
+
+        logger.info(f"{len(pages)} pages founds")
 
-        logger.info(f"{len(reader.pages)} pages founds")
+        # Cap the number of page batches being parsed at once
+        semaphore = asyncio.Semaphore(Configuration.parsing_concurrency)
 
-        async def _parse_data(page_batch: list[PageObject]) -> DataDictionary:
+        async def _parse_data(page_batch: list[str]) -> DataDictionary:
             # Ask OpenAI to format into markdown
-            resp = await self._client.responses.parse(
-                instructions=self._parse_prompt,
-                input="\n".join([page.extract_text() for page in page_batch]),
-                model=Configuration.parsing_model,
-                text_format=DataDictionary
-            )
+            async with semaphore:
+                resp = await self._client.responses.parse(
+                    instructions=self._parse_prompt,
+                    input="\n".join(page_batch),
+                    model=Configuration.parsing_model,
+                    text_format=DataDictionary
+                )
             return resp.output_parsed
 
-        if len(reader.pages) <= batch_size:
-            field_definitions = (await _parse_data(reader.pages)).field_defintions
+        if len(pages) <= batch_size:
+            field_definitions = (await _parse_data(pages)).field_defintions
         else:
             page_batches = [
                 pages[i : i + batch_size]
                 for i in range(0, len(pages), window_size)
             ]
             results = await asyncio.gather(*[_parse_data(page_batch) for page_batch in page_batches])
-            field_definitions = [result.field_defintions for result in results]
-            field_definitions = sum(field_definitions, [])
+            # Overlapping windows can parse the same field twice, keep the first one seen
+            unique_definitions: dict[str, FieldDefinition] = {}
+            for result in results:
+                for fld in result.field_defintions:
+                    unique_definitions.setdefault(fld.name, fld)
+            field_definitions = list(unique_definitions.values())
 
         # Turn each FieldDefinition into a document with id/text/metadata
         docs: List[Dict[str, Any]] = []
         for idx, fld in enumerate(field_definitions):
-            print(fld)
+            logger.debug("Parsed field definition: %s", fld)
             id_ = hash(table+str(pdf_path.name)+str(idx))
             docs.append({
                 "id":   id_,
@@ -136,6 +151,6 @@ class FieldDefinitionStore(DocumentStore):
                 "source": str(pdf_path.name),
                 **fld.model_dump()  # all other metadata
             })
-        json.dump(docs, open("./docs.json", "w"))
+        pathlib.Path("./docs.json").write_bytes(orjson.dumps(docs))
         # Batch-add all our field-definition docs
-        await self.add(docs, index_key="id", text_key="text")
\ No newline at end of file
+        await self.add(docs, text_key="text")
\ No newline at end of file
@@ -0,0 +1,78 @@
+import time
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Bounded cache of query results keyed by the query's embedding. A new query whose embedding is
+        within `threshold` cosine similarity of a cached query, with the same k, is served the
+        cached results instead of searching the index. Entries are evicted first-in-first-out,
+        and expire after `ttl` seconds.
+
+    Embeddings are expected to be normalized, so the dot product is the cosine similarity.
+
+    Entries are also indexed by their exact query text, so a repeated query can be served before
+        it is even embedded.
+    """
+
+    def __init__(self, dim: int, size: int, threshold: float, ttl: float):
+        self.size = size
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vecs = np.zeros((size, dim), dtype="float32")
+        self._ks = np.full(size, -1, dtype="int64")
+        self._created = np.zeros(size, dtype="float64")
+        self._results: list[list[dict]] = [None] * size
+        self._texts: list[tuple[str, int]] = [None] * size
+        self._slots_by_text: dict[tuple[str, int], int] = {}
+        self._next = 0
+
+    def _copy(self, i: int) -> list[dict]:
+        return [dict(doc) for doc in self._results[i]]
+
+    def get_exact(self, text: str, k: int) -> list[dict] | None:
+        """
+        Returns a copy of the cached results for this exact query text, or None on a miss
+        """
+        i = self._slots_by_text.get((text, k))
+        if i is None or time.monotonic() - self._created[i] > self.ttl:
+            return None
+        return self._copy(i)
+
+    def get(self, vec: np.ndarray, k: int) -> list[dict] | None:
+        """
+        Returns a copy of the cached results for the closest matching query, or None on a miss
+        """
+        valid = (self._ks == k) & (time.monotonic() - self._created <= self.ttl)
+        if not valid.any():
+            return None
+        # Score every entry with one matmul, ignoring empty, expired, or other k entries
+        sims = np.where(valid, self._vecs @ vec, -np.inf)
+        best = int(sims.argmax())
+        if sims[best] < self.threshold:
+            return None
+        return self._copy(best)
+
+    def put(self, vec: np.ndarray, k: int, results: list[dict], text: str = None):
+        """
+        Caches the results for a query, replacing the oldest entry once full
+        """
+        i = self._next
+        # Forget the text of the entry being replaced
+        if self._texts[i] is not None and self._slots_by_text.get(self._texts[i]) == i:
+            del self._slots_by_text[self._texts[i]]
+        self._vecs[i] = vec
+        self._ks[i] = k
+        self._created[i] = time.monotonic()
+        self._results[i] = [dict(doc) for doc in results]
+        self._texts[i] = (text, k) if text is not None else None
+        if text is not None:
+            self._slots_by_text[(text, k)] = i
+        self._next = (i + 1) % self.size
+
+    def clear(self):
+        self._ks[:] = -1
+        self._results = [None] * self.size
+        self._texts = [None] * self.size
+        self._slots_by_text.clear()
+        self._next = 0
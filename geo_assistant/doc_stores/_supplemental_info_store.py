@@ -4,11 +4,9 @@ import hashlib
 from typing import Union, Any, Dict, List
 from pydantic import BaseModel, Field
 
-from PyPDF2 import PdfReader, PageObject
-
 from geo_assistant.logging import get_logger
 from geo_assistant.config import Configuration
-from geo_assistant.doc_stores._base import DocumentStore
+from geo_assistant.doc_stores._base import DocumentStore, extract_pdf_pages
 
 
 logger = get_logger(__name__)
@@ -62,44 +60,32 @@ class SupplementalInfoStore(DocumentStore):
         parsing them via OpenAI, embedding the result, and persisting.
         """
         pdf_path    = pathlib.Path(pdf_path)
-        reader      = PdfReader(pdf_path)
-
-        if start_page and end_page:
-            pages = reader.pages[start_page:end_page]
-        elif start_page:
-            pages = reader.pages[start_page:]
-        elif end_page:
-            pages = reader.pages[:end_page]
-        else:
-            pages= reader.pages
-        
+        pages       = await extract_pdf_pages(pdf_path, start_page, end_page)
 
-        page_batches = [
-            pages[i : i + batch_size]
-            for i in range(0, len(pages), window_size)
-        ]
 
+        # Cap the number of page batches being parsed at once
+        semaphore = asyncio.Semaphore(Configuration.parsing_concurrency)
 
-        async def _parse_data(page_batch: list[PageObject]):
+        async def _parse_data(page_batch: list[str]):
             # Ask OpenAI to format into markdown
-            resp = await self._client.responses.parse(
-                instructions=self._parse_prompt,
-                input="\n".join([page.extract_text() for page in page_batch]),
-                model=Configuration.parsing_model,
-                text_format=SupplementalInfo
-            )
+            async with semaphore:
+                resp = await self._client.responses.parse(
+                    instructions=self._parse_prompt,
+                    input="\n".join(page_batch),
+                    model=Configuration.parsing_model,
+                    text_format=SupplementalInfo
+                )
             return resp.output_parsed
         
-        if len(reader.pages) <= batch_size:
-            sections = (await _parse_data(reader.pages)).sections
+        if len(pages) <= batch_size:
+            sections = (await _parse_data(pages)).sections
         else:
             page_batches = [
                 pages[i : i + batch_size]
                 for i in range(0, len(pages), window_size)
             ]
             results = await asyncio.gather(*[_parse_data(page_batch) for page_batch in page_batches])
-            sections = [result.sections for result in results]
-            sections = sum(sections, [])
+            sections = [section for result in results for section in result.sections]
 
 
         docs: List[Dict[str, Any]] = [
@@ -114,4 +100,4 @@ class SupplementalInfoStore(DocumentStore):
         ]
 
         # 5) Batch-add into FAISS + JSON
-        await self.add(docs, index_key="id", text_key="text")
\ No newline at end of file
+        await self.add(docs, text_key="text")
\ No newline at end of file
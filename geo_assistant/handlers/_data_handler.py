@@ -63,6 +63,16 @@ class PostGISHandler:
             return []
 
 
+    @staticmethod
+    def _count_sql(table: Table, filters: list[HandlerFilter] = None) -> str:
+        """
+        Helper function to build the row count query for a table and set of filters
+        """
+        if filters:
+            where_clause = " AND ".join(f._to_sql() for f in filters)
+            return f"SELECT COUNT(*) FROM {table.schema}.{table.name} AS {table.name} WHERE {where_clause}"
+        return f"SELECT COUNT(*) FROM {table.schema}.{table.name}"
+
     def filter_count(
         self,
         engine: Engine,
@@ -80,12 +90,30 @@ class PostGISHandler:
         Returns:
             int: The number of rows that meet the criterial of the filter
         """
-        total_count = 0
-        if filters:
-            where_clause = " AND ".join(f._to_sql() for f in filters)
-            sql = f"SELECT COUNT(*) FROM {table.schema}.{table.name} AS {table.name} WHERE {where_clause};"
-        else:
-            sql = f"SELECT COUNT(*) FROM {table.schema}.{table.name}"
+        return self.filter_counts(engine, [(table, filters)])[0]
+
+    def filter_counts(
+        self,
+        engine: Engine,
+        queries: list[tuple[Table, list[HandlerFilter] | None]],
+    ) -> list[int]:
+        """
+        Counts the number of rows found for several (table, filters) pairs at once. Each count is
+            a scalar subquery of a single statement, so any number of counts cost one round trip
+
+        Args:
+            engine (Engine): A sqlalchemy engine
+            queries (list[tuple[Table, list[HandlerFilter]]]): The tables and filters to count
+        
+        Returns:
+            list[int]: The number of rows for each pair, in the order they were given
+        """
+        if not queries:
+            return []
+        columns = ", ".join(
+            f"({self._count_sql(table, filters)}) AS count_{i}"
+            for i, (table, filters) in enumerate(queries)
+        )
         with engine.connect() as conn:
-            total_count += conn.execute(text(sql)).scalar()
-        return total_count
\ No newline at end of file
+            row = conn.execute(text(f"SELECT {columns};")).one()
+        return list(row)
@@ -2,6 +2,29 @@ from pydantic import BaseModel
 from typing import Any, Literal
 from urllib.parse import quote
 
+
+# Operator lookups, built once rather than on every export
+_CQL_OPS = {
+    "equal": "=",
+    "greaterThan": ">",
+    "lessThan": "<",
+    "greaterThanOrEqual": ">=",
+    "lessThanOrEqual": "<=",
+    "notEqual": "<>",
+    "contains": "LIKE"
+}
+
+_SQL_OPS = {
+    "equal": "=",
+    "greaterThan": ">",
+    "lessThan": "<",
+    "greaterThanOrEqual": ">=",
+    "lessThanOrEqual": "<=",
+    "notEqual": "!=",
+    "contains": "~"
+}
+
+
 class HandlerFilter(BaseModel):
     """
     Filters that can be used / exported as either a sql command or cql statement
@@ -15,17 +38,7 @@ class HandlerFilter(BaseModel):
         """
         Exports filter as a url-safe cql statement
         """
-        op_mapping = {
-            "equal": "=",
-            "greaterThan": ">",
-            "lessThan": "<",
-            "greaterThanOrEqual": ">=",
-            "lessThanOrEqual": "<=",
-            "notEqual": "<>",
-            "contains": "LIKE"
-        }
-
-        cql_op = op_mapping[self.op]
+        cql_op = _CQL_OPS[self.op]
         if self.op=='contains':
             value = f"%{self.value}%"
         else:
@@ -51,17 +64,7 @@ class HandlerFilter(BaseModel):
         """
         Exports the filter as a SQL WHERE clause
         """
-        op_mapping = {
-            "equal": "=",
-            "greaterThan": ">",
-            "lessThan": "<",
-            "greaterThanOrEqual": ">=",
-            "lessThanOrEqual": "<=",
-            "notEqual": "!=",
-            "contains": "~"
-        }
-
-        sql_op = op_mapping[self.op]
+        sql_op = _SQL_OPS[self.op]
 
         # format the value as a CQL literal
         if isinstance(self.value, str):
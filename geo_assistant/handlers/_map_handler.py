@@ -28,6 +28,9 @@ class PlotlyMapHandler:
         self.map_layers: dict[str, dict] = {}
         self._layer_filters: dict[str, list[HandlerFilter]] = defaultdict(list)
         self._active_table: Table = None
+        # Incremented on every change to the layers, lets callers cheaply tell if the map changed.
+        #   Calls that leave the layers as they were do not count as a change
+        self._version: int = 0
 
         # Base Figure
         self.figure = go.Figure(go.Choroplethmapbox())  # empty scatter to initialize mapbox
@@ -76,23 +79,37 @@ class PlotlyMapHandler:
             "type": style,
         }
 
+        filters = filters or []
+        # Re-adding an identical layer leaves the map as is
+        if (
+            self.map_layers.get(layer_id) == layer
+            and self._layer_filters.get(layer_id) == filters
+            and self._active_table is table
+        ):
+            return
         self.map_layers[layer_id] = layer
-        self._layer_filters[layer_id] = filters or []
+        self._layer_filters[layer_id] = filters
         self._active_table = table
+        self._version += 1
         logger.debug(f"Added layer {layer_id}")
 
     def _remove_map_layer(self, layer_id: str) -> None:
         """
         Removes a specified layer from the map.
         """
-        self.map_layers.pop(layer_id, None)
+        if layer_id not in self.map_layers:
+            return
+        self.map_layers.pop(layer_id)
         self._layer_filters.pop(layer_id, None)
+        self._version += 1
         logger.debug(f"Removed layer {layer_id}")
 
     def _reset_map(self) -> None:
         """
         Clears all layers and resets bounds.
         """
+        if self.map_layers or self._active_table is not None:
+            self._version += 1
         self.map_layers.clear()
         self._layer_filters.clear()
         self._active_table = None
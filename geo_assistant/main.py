@@ -3,7 +3,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-import json
+import orjson
 import uvicorn
 from sqlalchemy import create_engine
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
@@ -30,7 +30,14 @@ app.add_middleware(
 )
 
 # 2) Initialize your GeoAgent (or other shared state)
-engine = create_engine(Configuration.db_connection_url)
+# Analysis steps, row counts and table postprocessing run concurrently in worker threads, each
+#   holding its own connection, so keep enough of them open to not queue on the pool
+engine = create_engine(
+    Configuration.db_connection_url,
+    pool_size=Configuration.db_pool_size,
+    max_overflow=Configuration.db_max_overflow,
+    pool_pre_ping=True,
+)
 agent = GeoAgent(
     engine=engine,
     map_handler=PlotlyMapHandler(),
@@ -57,7 +64,7 @@ async def websocket_endpoint(ws: WebSocket):
     try:
         while True:
             raw = await ws.receive_text()
-            data = json.loads(raw)
+            data = orjson.loads(raw)
             logger.info(f"Message recieved: {raw}")
 
             # only handle user messages
@@ -65,7 +72,7 @@ async def websocket_endpoint(ws: WebSocket):
                 continue
 
             user_message = data["message"]
-            await ws.send_text(json.dumps({'type': "user_message", "message": user_message}))
+            await ws.send_text(orjson.dumps({'type': "user_message", "message": user_message}).decode())
 
             # stream back all of your events—
             # chat_stream should be an async generator
@@ -1,4 +1,9 @@
+import time
+import itertools
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from typing import Self, Sequence, Union
 from pydantic import BaseModel
 from sqlalchemy import Engine, text
@@ -10,6 +15,25 @@ from geo_assistant.config import Configuration
 
 logger = get_logger(__name__)
 
+# Keep-alive connections to pg_tileserv, shared by every registry load / sync
+_TILESERV_WORKERS = 8
+_tileserv_session = requests.Session()
+_tileserv_session.mount(
+    "http://",
+    HTTPAdapter(pool_maxsize=_TILESERV_WORKERS)
+)
+_tileserv_session.mount(
+    "https://",
+    HTTPAdapter(pool_maxsize=_TILESERV_WORKERS)
+)
+# Last fetched tileserv index, and when it was fetched
+_tileserv_index: tuple[float, dict[str, dict]] = (float("-inf"), {})
+_tileserv_index_lock = threading.Lock()
+
+# Source of registry versions. Every change takes the next value, so a version is never reused,
+#   even when registrations run in parallel threads
+_registry_versions = itertools.count(1)
+
 
 class Table(BaseModel):
     name: str
@@ -22,7 +46,7 @@ class Table(BaseModel):
     #Set later after creation
     geometry_type: str = None
 
-    def filter(self, fields: list[str]) -> Self:
+    def filter(self, fields: Union[list[str], set[str]]) -> Self:
         new_table = self.model_copy()
         new_table.columns = [col for col in self.columns if col in fields]
         return new_table
@@ -61,8 +85,34 @@ class TableRegistry:
 
     def __init__(self):
         self.tables: dict[Table] = {}
+        # Changes whenever tables are added or removed, lets callers cheaply tell if the registry
+        #   changed
+        self._version: int = 0
+        self._base_tables_cache: tuple[int, list[Table]] = (-1, [])
+
+    def _changed(self) -> None:
+        self._version = next(_registry_versions)
+
+    @property
+    def base_tables(self) -> list[Table]:
+        """
+        Tables in the base schema, cached until the registry changes
+        """
+        version, tables = self._base_tables_cache
+        if version != self._version:
+            version = self._version
+            tables = self[('schema', Configuration.db_base_schema)]
+            self._base_tables_cache = (version, tables)
+        return tables
+
+    @property
+    def column_names(self) -> set[str]:
+        return {
+            column
+            for table in self.tables.values()
+            for column in table.columns
+        }
 
-    
     @property
     def schemas(self):
         return {
@@ -142,84 +192,137 @@ class TableRegistry:
             bounds=bounds
         )
 
+    @staticmethod
+    def _get_tileserv_index(max_age: float = Configuration.registry_ttl_s) -> dict[str, dict]:
+        """
+        Fetches the tileserv index, reusing the last fetched index if it is at most `max_age`
+            seconds old. Concurrent callers share a single fetch
+        """
+        global _tileserv_index
+        with _tileserv_index_lock:
+            fetched_at, index = _tileserv_index
+            if time.monotonic() - fetched_at > max_age:
+                index = _tileserv_session.get(
+                    f"{Configuration.pg_tileserv_url}/index.json"
+                ).json()
+                _tileserv_index = (time.monotonic(), index)
+            return index
+
     @classmethod
-    def load_from_tileserv(cls, engine: Engine) -> Self:
-        index = requests.get(
-            f"{Configuration.pg_tileserv_url}/index.json"
+    def _load_table(cls, info: dict, engine: Engine) -> Table:
+        """
+        Loads one table from its tileserv index entry, fetching its metadata and geometry type
+        """
+        metadata = _tileserv_session.get(
+            info['detailurl']
         ).json()
+        table = cls._extract_table_from_tileserv(
+            info, metadata
+        )
+        table.geometry_type = cls._get_geometry_type(
+            engine=engine,
+            schema=info['schema'],
+            table=info['name'],
+        )
+        return table
+
+    @classmethod
+    def _load_tables(cls, infos: dict[str, dict], engine: Engine) -> dict[str, Table]:
+        """
+        Loads many tables at once. Each table is a tileserv request and a database query, so they
+            are run on a thread pool rather than one after another
+        """
+        if not infos:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(_TILESERV_WORKERS, len(infos))) as pool:
+            tables = pool.map(lambda info: cls._load_table(info, engine), infos.values())
+            return dict(zip(infos.keys(), tables))
+
+    @classmethod
+    def load_from_tileserv(cls, engine: Engine) -> Self:
+        index = cls._get_tileserv_index()
 
         instance = cls()
-        for id_, info in index.items():
-            metadata = requests.get(
-                info['detailurl']
-            ).json()
-            table = cls._extract_table_from_tileserv(
-                info, metadata
-            )
-            table.geometry_type = cls._get_geometry_type(
-                engine=engine,
-                schema=info['schema'],
-                table=info['name'],
-            )
-            instance.tables[id_] = table
+        instance.tables.update(cls._load_tables(index, engine))
+        instance._changed()
         return instance
     
 
     def sync_tileserv(self, engine: Engine) -> Self:
-        index = requests.get(
-            f"{Configuration.pg_tileserv_url}/index.json"
-        ).json()
+        # Syncing is meant to pick up new tables, so always fetch a fresh index
+        index = self._get_tileserv_index(max_age=0)
 
-        for id_, info in index.items():
-            if id_ not in self.tables:
-                metadata = requests.get(
-                    info['detailurl']
-                ).json()
-                table = self._extract_table_from_tileserv(
-                    info, metadata
-                )
-                table.geometry_type = self._get_geometry_type(
-                    engine=engine,
-                    schema=info['schema'],
-                    table=info['name'],
-                )
-                self.tables[id_] = table
+        new_infos = {
+            id_: info
+            for id_, info in index.items()
+            if id_ not in self.tables
+        }
+        if new_infos:
+            self.tables.update(self._load_tables(new_infos, engine))
+            self._changed()
 
 
     def register(self, id_: str, engine: Engine) -> Table:
-        # Search index:
-        index = requests.get(
-            f"{Configuration.pg_tileserv_url}/index.json"
-        ).json()
+        # Search index, only refetching it if the table is not in the recent one
+        index = self._get_tileserv_index()
+        if id_ not in index:
+            index = self._get_tileserv_index(max_age=0)
 
-        info = index[id_]
-        metadata = requests.get(
-            info['detailurl']
-        ).json()
-        table = self._extract_table_from_tileserv(
-            info, metadata
-        )
-        table.geometry_type = self._get_geometry_type(
-            engine=engine,
-            schema=info['schema'],
-            table=info['name'],
-        )
+        table = self._load_table(index[id_], engine)
         self.tables[id_] = table
-    
-        return self.tables[id_]
+        self._changed()
+        return table
 
     def unregister(self, name: str, engine: Engine):
         for id_, table in self.tables.items():
             if table.name == name:
                 table._drop(engine)
                 del self.tables[id_]
+                self._changed()
                 return
     
+    def drop_many(self, engine: Engine, names: Sequence[str]) -> None:
+        """
+        Drops many tables with a single round-trip to the database, and removes any of them that
+            are registered from the registry. Tables are dropped by name, so tables that never
+            made it into the registry are still dropped
+
+        Args:
+            - engine: SQLAlchemy Engine connected to your PostGIS database.
+            - names: Qualified `schema.table` names of the tables to drop
+        """
+        if not names:
+            return
+        dropped = {tuple(name.split('.', 1)) for name in names}
+        execute_template_sql(
+            engine=engine,
+            template_name="drop_many",
+            tables=[{"schema": schema, "name": name} for schema, name in sorted(dropped)]
+        )
+        kept = {}
+        registered = set()
+        for id_, table in self.tables.items():
+            if (table.schema, table.name) in dropped:
+                registered.add((table.schema, table.name))
+            else:
+                kept[id_] = table
+        if missing := dropped - registered:
+            logger.warning(
+                "Dropped tables that were not in the registry: %s",
+                [f"{schema}.{name}" for schema, name in sorted(missing)]
+            )
+        if registered:
+            self.tables = kept
+            self._changed()
+
     def cleanup(self, engine: Engine):
-        for schema in self.schemas:
-            if schema != Configuration.db_base_schema:
-                logger.info(f"Dropping schema: {schema}")
-                self.drop_schema(engine, schema)
+        schemas = [
+            schema
+            for schema in self.schemas
+            if schema != Configuration.db_base_schema
+        ]
+        logger.info(f"Dropping schemas: {schemas}")
+        self.drop_schemas(engine, schemas)
 
 
     def __getitem__(self, key) -> list[Table]:
@@ -285,12 +388,13 @@ class TableRegistry:
             elif kind == 'fields':
                 if not isinstance(val, Sequence) or isinstance(val, str):
                     raise TypeError("For 'fields', provide a list/tuple of field names")
-                field_list = list(val)
+                # Set, as each table checks every one of its columns against it
+                field_set = set(val)
 
                 # for fields, replace each table with its filtered version (if it yields any columns)
                 new_candidates = []
                 for table in candidates:
-                    filtered = table.filter(field_list)
+                    filtered = table.filter(field_set)
                     if filtered.columns:
                         new_candidates.append(filtered)
                 candidates = new_candidates
@@ -305,24 +409,39 @@ class TableRegistry:
             - engine: an initialized SQLAlchemy Engine
             - schema_name: name of the schema to drop
         """
-        sql = text(f'DROP SCHEMA IF EXISTS "{schema_name}" CASCADE;')
+        self.drop_schemas(engine, [schema_name])
+
+    def drop_schemas(self, engine: Engine, schema_names: list[str]) -> None:
+        """
+        Drops many PostgreSQL/PostGIS schemas and all contained objects, in a single statement
+
+        Args:
+            - engine: an initialized SQLAlchemy Engine
+            - schema_names: names of the schemas to drop
+        """
+        if not schema_names:
+            return
+        names = ", ".join(f'"{schema_name}"' for schema_name in schema_names)
+        sql = text(f'DROP SCHEMA IF EXISTS {names} CASCADE;')
         with engine.begin() as conn:
             conn.execute(sql)
 
     def verify_fields(self, field_results: list[dict]):
-        updated_results = []
+        # Index the field results by lowercased name once, so each column is a single lookup
+        #   rather than a scan over every field result
+        results_by_name: dict[str, list[dict]] = {}
+        for field_result in field_results:
+            results_by_name.setdefault(field_result['name'].lower(), []).append(field_result)
 
+        updated_results = []
         for table in self.tables.values():
             for column in table.columns:
-                for field_result in field_results:
-                    if column.lower() == field_result['name'].lower():
-                        temp = field_result.copy()
-                        temp.pop('name')
-                        updated_results.append(
-                            {
-                                "name": column,
-                                **temp
-                            }
-                        )
+                for field_result in results_by_name.get(column.lower(), ()):
+                    updated_results.append(
+                        {
+                            **field_result,
+                            "name": column,
+                        }
+                    )
 
         return updated_results
@@ -0,0 +1,115 @@
+import time
+import asyncio
+import pytest
+from typing import Literal
+
+from geo_assistant.agent.analysis._analysis import _GISAnalysis
+from geo_assistant.agent.analysis._steps import _SQLStep, _SourceTable
+from geo_assistant.agent.analysis.report import TableCreated
+
+
+class StubStep(_SQLStep):
+    step_type: Literal["stub"] = "stub"
+    source_table: _SourceTable
+
+
+class StubAnalysis(_GISAnalysis):
+    """
+    Analysis that runs its steps without a database. Steps named `slow_*` take a moment and report
+        the table they created, steps named `fail_*` raise
+    """
+
+    def _create_schema(self, engine):
+        pass
+
+    def _run_step(self, step, engine):
+        if step.name.startswith("fail"):
+            raise RuntimeError(step.name)
+        if step.name.startswith("slow"):
+            time.sleep(0.2)
+        self.tables_created.append(f"{self.name}.{step.output_table}")
+        if step.name.startswith("slow"):
+            return TableCreated(name=step.name, reason=step.reasoning, table_created=step.output_table)
+        return None
+
+
+def _step(name: str, source_schema: str = "base", source_table: str = "parcels") -> StubStep:
+    return StubStep.model_construct(
+        name=name,
+        reasoning=name,
+        output_table=name,
+        source_table=_SourceTable.model_construct(
+            output_table_idx=None,
+            source_table=source_table,
+            source_schema=source_schema,
+        ),
+    )
+
+
+def _analysis(*steps: StubStep) -> StubAnalysis:
+    return StubAnalysis.model_construct(
+        name="analysis",
+        steps=list(steps),
+        final_tables=[],
+        tables_created=[],
+    )
+
+
+def _run(analysis: StubAnalysis, on_item=None) -> list[str]:
+    started = []
+
+    async def _emitter(update: dict):
+        started.append(update["step"])
+
+    asyncio.run(analysis.execute(id_="id", engine=None, emitter=_emitter, on_item=on_item))
+    return started
+
+
+def test_step_dependencies_only_include_analysis_tables():
+    analysis = _analysis()
+    assert analysis._step_dependencies(_step("a")) == set()
+    assert analysis._step_dependencies(_step("b", "analysis", "a")) == {"analysis.a"}
+
+
+def test_execute_runs_independent_steps_in_the_same_wave():
+    # b depends on a, c does not depend on anything
+    analysis = _analysis(_step("a"), _step("b", "analysis", "a"), _step("c"))
+
+    started = _run(analysis)
+
+    # a and c start together, b only once a has created its table
+    assert started == ["a", "c", "b"]
+    assert sorted(analysis.tables_created) == ["analysis.a", "analysis.b", "analysis.c"]
+
+
+def test_execute_reports_items_in_step_order():
+    analysis = _analysis(_step("slow_a"), _step("b", "analysis", "slow_a"), _step("slow_c"))
+    items = []
+
+    async def _on_item(item):
+        items.append(item.name)
+
+    report = asyncio.run(analysis.execute(id_="id", engine=None, on_item=_on_item))
+
+    assert sorted(items) == ["slow_a", "slow_c"]
+    assert [item.name for item in report.items] == ["slow_a", "slow_c"]
+
+
+def test_execute_failure_lets_the_wave_settle():
+    analysis = _analysis(
+        _step("fail_a"),
+        _step("slow_b"),
+        _step("c", "analysis", "slow_b"),
+    )
+    items = []
+
+    async def _on_item(item):
+        items.append(item.name)
+
+    with pytest.raises(RuntimeError, match="fail_a"):
+        _run(analysis, on_item=_on_item)
+
+    # The slow step in the failed wave finished and was reported before the failure was raised,
+    #   and no later wave was started
+    assert analysis.tables_created == ["analysis.slow_b"]
+    assert items == ["slow_b"]
@@ -0,0 +1,164 @@
+import asyncio
+import numpy as np
+import pytest
+from types import SimpleNamespace
+
+from geo_assistant.agent._base import (
+    BaseAgent,
+    tool,
+    system_message,
+    versioned_enum,
+    _encode_tool_output,
+)
+
+
+class EchoAgent(BaseAgent):
+
+    @system_message
+    def _system_message(self, user_message: str):
+        return "system"
+
+    @tool(
+        name="echo",
+        description="Echoes the text back",
+        params={"text": {"type": "string"}},
+        required=["text"],
+    )
+    def echo(self, text: str):
+        return text
+
+
+def _tool_call(name: str, arguments: str):
+    return SimpleNamespace(name=name, arguments=arguments, call_id="call-1")
+
+
+def _agent_with_turns(n_turns: int, chars: int = 400) -> EchoAgent:
+    # Each message is estimated at chars // 4 + 1 tokens
+    agent = EchoAgent()
+    agent._append_message({"role": "developer", "content": "system"})
+    for i in range(n_turns):
+        agent._append_message({"role": "user", "content": f"{i}" * chars})
+        agent._append_message({"role": "assistant", "content": f"{i}" * chars})
+    return agent
+
+
+def test_trim_messages_under_budget_keeps_everything():
+    agent = _agent_with_turns(3)
+    messages = list(agent.messages)
+    agent._trim_messages(max_tokens=10_000)
+    assert agent.messages == messages
+
+
+def test_trim_messages_cuts_oldest_turns_at_user_message():
+    agent = _agent_with_turns(3)
+    system, *_, last_user, last_ai = agent.messages
+
+    # Only the last turn (2 x 101 tokens) fits
+    agent._trim_messages(max_tokens=250)
+
+    assert agent.messages == [system, last_user, last_ai]
+    assert agent._history_tokens == 202
+    assert agent._message_tokens[1:] == [101, 101]
+
+
+def test_trim_messages_keeps_tool_calls_with_their_outputs():
+    agent = _agent_with_turns(1)
+    agent._append_message({"role": "user", "content": "x" * 400})
+    agent._append_message({"type": "function_call", "call_id": "1", "arguments": "x" * 400})
+    agent._append_message({"type": "function_call_output", "call_id": "1", "output": "x" * 400})
+    agent._append_message({"role": "assistant", "content": "x" * 400})
+
+    # The latest turn is over budget, but is never split
+    agent._trim_messages(max_tokens=250)
+
+    assert agent.messages[1]["role"] == "user"
+    assert [m.get("type") for m in agent.messages[2:4]] == ["function_call", "function_call_output"]
+
+
+def test_trim_messages_keeps_latest_turn_over_budget():
+    agent = _agent_with_turns(1, chars=2000)
+    messages = list(agent.messages)
+    agent._trim_messages(max_tokens=100)
+    assert agent.messages == messages
+
+
+def test_versioned_enum_only_rebuilt_when_version_changes():
+    agent = EchoAgent()
+    state = {"version": 1, "values": ["a"], "builds": 0}
+
+    def _values(self):
+        state["builds"] += 1
+        return list(state["values"])
+
+    builder = versioned_enum(lambda self: state["version"], _values)
+
+    assert agent._resolve_enum("tool", "param", builder) == (["a"], ("a",))
+    # Same version, the last values are reused
+    state["values"] = ["b"]
+    assert agent._resolve_enum("tool", "param", builder) == (["a"], ("a",))
+    # New version, rebuilt
+    state["version"] = 2
+    assert agent._resolve_enum("tool", "param", builder) == (["b"], ("b",))
+    assert state["builds"] == 2
+
+
+def test_unversioned_enum_rebuilt_every_time():
+    agent = EchoAgent()
+    builds = []
+
+    def _values(self):
+        builds.append(1)
+        return ["a"]
+
+    agent._resolve_enum("tool", "param", _values)
+    agent._resolve_enum("tool", "param", _values)
+    assert len(builds) == 2
+
+
+class _Unserializable:
+    def __str__(self):
+        return "unserializable"
+
+
+@pytest.mark.parametrize(
+    "result,expected",
+    [
+        ("text", "text"),
+        (b"bytes", "bytes"),
+        ({"a": 1}, '{"a":1}'),
+        ([1, 2], "[1,2]"),
+        (np.array([1, 2]), "[1,2]"),
+        (_Unserializable(), "unserializable"),
+    ],
+)
+def test_encode_tool_output(result, expected):
+    assert _encode_tool_output(result) == expected
+
+
+def test_call_tool_runs_tool():
+    agent = EchoAgent()
+    result = asyncio.run(agent._call_tool(_tool_call("echo", '{"text": "hi"}')))
+    assert result == ("hi", True)
+
+
+@pytest.mark.parametrize(
+    "name,arguments",
+    [
+        # Malformed arguments from the model
+        ("echo", '{"text": '),
+        # Tool that does not exist
+        ("not_a_tool", "{}"),
+        # Method that is not declared as a tool
+        ("_trim_messages", "{}"),
+    ],
+)
+def test_call_tool_failures_are_narrated(name, arguments):
+    agent = _agent_with_turns(3)
+    messages = list(agent.messages)
+
+    result, narrate = asyncio.run(agent._call_tool(_tool_call(name, arguments)))
+
+    assert narrate is True
+    assert f"Tool `{name}` failed" in result
+    # Nothing that is not a tool was called
+    assert agent.messages == messages
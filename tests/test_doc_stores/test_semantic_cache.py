@@ -0,0 +1,72 @@
+import numpy as np
+
+from geo_assistant.doc_stores._semantic_cache import SemanticCache
+
+
+def _vec(*values: float) -> np.ndarray:
+    vec = np.array(values, dtype="float32")
+    return vec / np.linalg.norm(vec)
+
+
+def _cache(**kwargs) -> SemanticCache:
+    params = {"dim": 2, "size": 2, "threshold": 0.95, "ttl": 60.0} | kwargs
+    return SemanticCache(**params)
+
+
+def test_get_matches_similar_query():
+    cache = _cache()
+    cache.put(_vec(1, 0), k=3, results=[{"id": 1}])
+
+    assert cache.get(_vec(1, 0.01), k=3) == [{"id": 1}]
+    # Not similar enough
+    assert cache.get(_vec(1, 1), k=3) is None
+    # Same query, different k
+    assert cache.get(_vec(1, 0), k=5) is None
+
+
+def test_get_returns_copies():
+    cache = _cache()
+    cache.put(_vec(1, 0), k=3, results=[{"id": 1}])
+
+    cache.get(_vec(1, 0), k=3)[0]["id"] = 2
+
+    assert cache.get(_vec(1, 0), k=3) == [{"id": 1}]
+
+
+def test_get_exact_by_text():
+    cache = _cache()
+    cache.put(_vec(1, 0), k=3, results=[{"id": 1}], text="parcels")
+
+    assert cache.get_exact("parcels", k=3) == [{"id": 1}]
+    assert cache.get_exact("parcels", k=5) is None
+    assert cache.get_exact("zoning", k=3) is None
+
+
+def test_put_evicts_oldest_entry():
+    cache = _cache()
+    cache.put(_vec(1, 0), k=3, results=[{"id": 1}], text="first")
+    cache.put(_vec(0, 1), k=3, results=[{"id": 2}], text="second")
+    cache.put(_vec(-1, 0), k=3, results=[{"id": 3}], text="third")
+
+    assert cache.get(_vec(1, 0), k=3) is None
+    assert cache.get_exact("first", k=3) is None
+    assert cache.get_exact("second", k=3) == [{"id": 2}]
+    assert cache.get_exact("third", k=3) == [{"id": 3}]
+
+
+def test_entries_expire():
+    cache = _cache(ttl=-1.0)
+    cache.put(_vec(1, 0), k=3, results=[{"id": 1}], text="parcels")
+
+    assert cache.get(_vec(1, 0), k=3) is None
+    assert cache.get_exact("parcels", k=3) is None
+
+
+def test_clear():
+    cache = _cache()
+    cache.put(_vec(1, 0), k=3, results=[{"id": 1}], text="parcels")
+
+    cache.clear()
+
+    assert cache.get(_vec(1, 0), k=3) is None
+    assert cache.get_exact("parcels", k=3) is None
@@ -0,0 +1,82 @@
+from geo_assistant.handlers._data_handler import PostGISHandler
+from geo_assistant.handlers._filter import HandlerFilter
+from geo_assistant.table_registry import Table
+
+
+class FakeEngine:
+    """
+    Records the SQL it is sent, answering with a single row
+    """
+
+    def __init__(self, row: tuple):
+        self.row = row
+        self.statements: list[str] = []
+
+    def connect(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, stmt):
+        self.statements.append(str(stmt))
+        return self
+
+    def one(self):
+        return self.row
+
+
+def _table(name: str) -> Table:
+    return Table(
+        name=name,
+        schema="base",
+        columns=["id", "zone"],
+        index_url="",
+        tile_url="",
+        bounds={},
+    )
+
+
+def test_count_sql_without_filters():
+    assert PostGISHandler._count_sql(_table("parcels")) == "SELECT COUNT(*) FROM base.parcels"
+
+
+def test_count_sql_with_filters():
+    filters = [
+        HandlerFilter(field="zone", value="R'1", op="equal"),
+        HandlerFilter(field="id", value=10, op="greaterThan"),
+    ]
+    assert PostGISHandler._count_sql(_table("parcels"), filters) == (
+        "SELECT COUNT(*) FROM base.parcels AS parcels "
+        "WHERE \"zone\" = 'R''1' AND \"id\" > 10"
+    )
+
+
+def test_filter_counts_single_round_trip():
+    engine = FakeEngine(row=(5, 7))
+    filters = [HandlerFilter(field="zone", value="R1", op="equal")]
+
+    counts = PostGISHandler().filter_counts(
+        engine,
+        [(_table("parcels"), filters), (_table("streets"), None)],
+    )
+
+    assert counts == [5, 7]
+    assert engine.statements == [
+        "SELECT (SELECT COUNT(*) FROM base.parcels AS parcels WHERE \"zone\" = 'R1') AS count_0, "
+        "(SELECT COUNT(*) FROM base.streets) AS count_1;"
+    ]
+
+
+def test_filter_counts_without_queries_skips_database():
+    engine = FakeEngine(row=())
+    assert PostGISHandler().filter_counts(engine, []) == []
+    assert engine.statements == []
+
+
+def test_filter_count():
+    engine = FakeEngine(row=(3,))
+    assert PostGISHandler().filter_count(engine, _table("parcels")) == 3
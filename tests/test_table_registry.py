@@ -0,0 +1,90 @@
+import pytest
+
+from geo_assistant import table_registry
+from geo_assistant.table_registry import Table, TableRegistry
+from geo_assistant._sql._sql_exec import _render_sql
+
+
+def _table(schema: str, name: str, columns: list[str] = None) -> Table:
+    return Table(
+        name=name,
+        schema=schema,
+        columns=columns or ["id"],
+        index_url="",
+        tile_url="",
+        bounds={},
+    )
+
+
+@pytest.fixture
+def registry() -> TableRegistry:
+    registry = TableRegistry()
+    registry.tables = {
+        "base.parcels": _table("base", "parcels", ["id", "Zone"]),
+        "analysis.step_1": _table("analysis", "step_1", ["id", "zone"]),
+        "analysis.step_2": _table("analysis", "step_2"),
+    }
+    return registry
+
+
+@pytest.fixture
+def executed(monkeypatch) -> list[dict]:
+    calls = []
+    monkeypatch.setattr(
+        table_registry,
+        "execute_template_sql",
+        lambda **kwargs: calls.append(kwargs),
+    )
+    return calls
+
+
+def test_drop_many_drops_and_unregisters(registry, executed):
+    version = registry._version
+
+    registry.drop_many(None, ["analysis.step_2", "analysis.step_1"])
+
+    assert len(executed) == 1
+    assert executed[0]["template_name"] == "drop_many"
+    assert executed[0]["tables"] == [
+        {"schema": "analysis", "name": "step_1"},
+        {"schema": "analysis", "name": "step_2"},
+    ]
+    assert list(registry.tables) == ["base.parcels"]
+    assert registry._version != version
+
+
+def test_drop_many_drops_unregistered_tables(registry, executed, caplog):
+    version = registry._version
+
+    registry.drop_many(None, ["analysis.never_registered"])
+
+    # Still dropped, only the registry is left alone
+    assert executed[0]["tables"] == [{"schema": "analysis", "name": "never_registered"}]
+    assert len(registry.tables) == 3
+    assert registry._version == version
+    assert "analysis.never_registered" in caplog.text
+
+
+def test_drop_many_without_names_skips_database(registry, executed):
+    registry.drop_many(None, [])
+    assert executed == []
+
+
+def test_drop_many_template_guards_missing_tables():
+    sql = _render_sql(
+        "drop_many",
+        tables=[{"schema": "analysis", "name": "step_1"}, {"schema": "analysis", "name": "step_2"}],
+    )
+
+    assert "to_regclass('\"analysis\".\"step_1\"') IS NOT NULL" in sql
+    assert 'DROP TABLE IF EXISTS "analysis"."step_1", "analysis"."step_2" CASCADE;' in sql
+
+
+def test_verify_fields_uses_table_column_names(registry):
+    results = registry.verify_fields([{"name": "zone", "description": "Zoning"}])
+
+    # Once per table with the column, using the table's own casing
+    assert results == [
+        {"name": "Zone", "description": "Zoning"},
+        {"name": "zone", "description": "Zoning"},
+    ]